@@ -1,4 +1,7 @@
 from inspect import isfunction
+from distutils.version import StrictVersion
+
+import django
 
 from django.db.models.base import ModelBase
 from importlib import import_module
@@ -13,6 +16,7 @@ from flash.base import (
         ModelCacheManager, InstanceCache, RelatedInstanceCache,
         QuerysetCache, QuerysetExistsCache, RelatedQuerysetCache,
         DontCache, BatchCacheQuery, InvalidationType)
+from flash.request_cache import use_request_cache
 
 
 def load_caches():
@@ -39,7 +43,12 @@ def get_cache_manager(self):
 
 ModelBase.cache = property(get_cache_manager)
 
-# Register signals for fields_diff
+# Patch models to get state diff
 import flash.fields_diff
 
+if StrictVersion(django.get_version()) < StrictVersion('1.7'):
+    # There is no FlashConfig.ready, so connect receivers for models as
+    # cache classes get registered on them.
+    flash.signal_receivers.connect_receivers()
+
 default_app_config = 'flash.apps.FlashConfig'
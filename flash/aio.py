@@ -0,0 +1,185 @@
+""" asyncio counterparts of getting values of cache queries, which don't
+block the event loop.
+
+Values are got from cache backend using its async methods if it has them
+(Django 4.0+) or else in a thread, and from fallback methods in threads of
+fallback pool. Steps of cache queries in between also call cache and db
+(E.g. to get dynamic versions and generations, or to take leases, locks
+and set values), so they are run in threads of fallback pool too. Cache
+queries awaited in the same iteration of event loop are resolved
+together, like BatchCacheQuery.
+"""
+import asyncio
+import time
+import weakref
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import Http404
+
+from flash import settings as flash_settings
+from flash.base import (
+        cache, BatchCacheQuery, batch_cache_writes,
+        get_many_from_request_cache, get_many_from_process_cache,
+        remember_process_values, remember_backend_values, split_stale_data,
+        get_lease_poll_interval, get_leased_cache_keys,
+        collect_leased_values, remember_leased_values)
+from flash.deferred_invalidation import get_pending_keys
+from flash.fallback_pool import fallback_pool
+from flash.process_cache import process_cache
+
+
+def aget_many_from_backend(keys):
+    aget_many = getattr(cache, 'aget_many', None)
+    if aget_many is not None:
+        return aget_many(keys)
+    loop = asyncio.get_event_loop()
+    return loop.run_in_executor(None, cache.get_many, keys)
+
+
+async def acache_get_many(keys):
+    """ await counterpart of cache_get_many
+    """
+    if not keys:
+        return {}, {}
+
+    pending_keys = get_pending_keys(keys)
+    d, keys = get_many_from_request_cache(keys)
+    if keys and process_cache.entries:
+        # process cache checks dynamic versions of values found in it
+        process_dict, keys = await run_in_fallback_pool(
+            get_many_from_process_cache, keys)
+        d.update(process_dict)
+        remember_process_values(process_dict)
+    if keys:
+        backend_dict = await aget_many_from_backend(keys)
+        remember_backend_values(keys, backend_dict)
+        d.update(backend_dict)
+    return split_stale_data(d, pending_keys)
+
+
+async def await_leased_values(leased_dict):
+    """ await counterpart of wait_for_leased_values
+    """
+    found_dict = {}
+    pending_dict = dict(leased_dict)
+    start_time = time.time()
+    while pending_dict:
+        await asyncio.sleep(get_lease_poll_interval(pending_dict))
+        d = await aget_many_from_backend(get_leased_cache_keys(pending_dict))
+        collect_leased_values(pending_dict, d, found_dict,
+                              time.time() - start_time)
+    remember_leased_values(found_dict)
+    return found_dict
+
+
+def run_in_fallback_pool(func, *args):
+    return asyncio.wrap_future(fallback_pool.submit(func, *args))
+
+
+def send_batching_writes(coroutine, value):
+    # values of all queries are set in cache together
+    with batch_cache_writes():
+        return coroutine.send(value)
+
+
+async def get_batch_query_async(batch_query, only_cache=False,
+                                none_on_exception=False,
+                                return_exceptions=False):
+    """ Drives BatchCacheQuery.get_coroutine without blocking the event loop.
+
+    The coroutine is resumed in threads of fallback pool, one step at a
+    time. Only getting values from cache and waiting for leased values is
+    done by the event loop.
+    """
+    coroutine = batch_query.get_coroutine(only_cache, none_on_exception,
+                                          return_exceptions)
+    all_cache_keys = await run_in_fallback_pool(coroutine.send, None)
+    if flash_settings.DONT_USE_CACHE:
+        result = {}, {}
+    else:
+        result = await acache_get_many(all_cache_keys)
+    leased_dict = await run_in_fallback_pool(coroutine.send, result)
+    found_dict = {}
+    if leased_dict:
+        found_dict = await await_leased_values(leased_dict)
+    fallback_groups = await run_in_fallback_pool(coroutine.send, found_dict)
+    # groups of different cache classes and dbs are resolved in parallel
+    results_list = await asyncio.gather(*[
+        run_in_fallback_pool(BatchCacheQuery.resolve_fallback_group,
+                             *fallback_group)
+        for fallback_group in fallback_groups])
+    return await run_in_fallback_pool(send_batching_writes, coroutine,
+                                      list(results_list))
+
+
+class BatchLoader(object):
+    """ Collects cache queries loaded in an iteration of event loop and
+        gets their values together. Queries having the same key share the
+        value.
+    """
+    def __init__(self, loop):
+        self.loop = loop
+        # key of query -> (cache query, future of value)
+        self.pending = {}
+
+    def load(self, cache_query):
+        key = cache_query.key
+        if key in self.pending:
+            return self.pending[key][1]
+        if not self.pending:
+            self.loop.call_soon(self.dispatch)
+        future = self.loop.create_future()
+        self.pending[key] = (cache_query, future)
+        return future
+
+    def dispatch(self):
+        pending, self.pending = self.pending, {}
+        self.loop.create_task(self.resolve(pending))
+
+    async def resolve(self, pending):
+        batch_query = BatchCacheQuery(dict(
+            (key, cache_query) for key, (cache_query, _) in pending.items()))
+        try:
+            value_dict = await get_batch_query_async(
+                batch_query, return_exceptions=True)
+        except Exception as e:
+            for _, future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, (_, future) in pending.items():
+            if future.done():
+                # cancelled
+                continue
+            value = value_dict[key]
+            if isinstance(value, Exception):
+                future.set_exception(value)
+            else:
+                future.set_result(value)
+
+
+_loaders = weakref.WeakKeyDictionary()
+
+
+def load(cache_query):
+    """ Returns future of value of cache query, which is got along with
+    other queries loaded in the same iteration of event loop.
+    """
+    loop = asyncio.get_event_loop()
+    loader = _loaders.get(loop)
+    if loader is None:
+        loader = _loaders[loop] = BatchLoader(loop)
+    return loader.load(cache_query)
+
+
+async def object_or_none(future):
+    try:
+        return await future
+    except ObjectDoesNotExist:
+        return None
+
+async def object_or_404(future):
+    try:
+        return await future
+    except ObjectDoesNotExist as e:
+        raise Http404(str(e))
@@ -11,3 +11,5 @@ class FlashConfig(AppConfig):
         from flash.base import ModelCacheManagerMeta
         ModelCacheManagerMeta.create_cache_managers_from_models()
         ModelCacheManagerMeta.patch_cached_foreignkeys()
+        from flash.signal_receivers import connect_receivers
+        connect_receivers()
@@ -1,10 +1,12 @@
 import six
 import time
 import copy
+import threading
 
 from distutils.version import StrictVersion
 from abc import ABCMeta, abstractmethod, abstractproperty
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
 from functools import partial
 
 import django
@@ -16,8 +18,9 @@ except ImportError:
     def get_cache(backend):
         return caches[backend]
 
+from django.core.exceptions import ObjectDoesNotExist
 from django.http import Http404
-from django.db import models, transaction
+from django.db import models, transaction, DEFAULT_DB_ALIAS
 
 try:
     from django.db.models import get_models
@@ -47,6 +50,14 @@ def importGenericForeignKey():
 
 from flash import settings as flash_settings
 from flash.option import Some
+from flash.request_cache import get_request_cache
+from flash.deferred_invalidation import get_pending_keys
+from flash.fields_diff import track_fields
+from flash.process_cache import process_cache
+from flash.refresh_pool import refresh_pool
+from flash.fallback_pool import fallback_pool
+from flash.single_flight import resolve_once
+from flash.serializers import SchemaChanged, get_default_serializer
 from flash.utils import memcache_key_escape, flash_properties
 
 
@@ -89,6 +100,16 @@ class StaleData(object):
     def __init__(self, timestamp):
         self.timestamp = timestamp
 
+    def __eq__(self, other):
+        return (isinstance(other, StaleData) and
+                self.timestamp == other.timestamp)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.timestamp)
+
     def __str__(self):
         return "StaleData(timestamp=%s)" % self.timestamp
 
@@ -97,7 +118,75 @@ def cache_get_many(keys):
     if not keys:
         return {}, {}
 
-    d = cache.get_many(keys)
+    pending_keys = get_pending_keys(keys)
+    d, keys = get_many_from_local_caches(keys)
+    if keys:
+        backend_dict = cache.get_many(keys)
+        remember_backend_values(keys, backend_dict)
+        d.update(backend_dict)
+    return split_stale_data(d, pending_keys)
+
+
+def get_many_from_local_caches(keys):
+    """ Returns dict of keys found in request cache or process cache and
+    list of keys to be got from cache backend.
+    """
+    d, keys = get_many_from_request_cache(keys)
+    if keys:
+        process_dict, keys = get_many_from_process_cache(keys)
+        d.update(process_dict)
+        remember_process_values(process_dict)
+    return d, keys
+
+
+def get_many_from_request_cache(keys):
+    """ Returns dict of keys found in request cache and list of other keys.
+    """
+    request_cache = get_request_cache()
+    if request_cache is None:
+        return {}, keys
+    return request_cache.get_many(keys)
+
+
+def get_many_from_process_cache(keys):
+    """ Returns dict of keys found in process cache and list of other keys.
+    """
+    process_dict = process_cache.get_many(keys)
+    if process_dict:
+        keys = [key for key in keys if key not in process_dict]
+    return process_dict, keys
+
+
+def remember_process_values(process_dict):
+    """ Keeps values got from process cache in request cache.
+    """
+    request_cache = get_request_cache()
+    if process_dict and request_cache is not None:
+        request_cache.set_many(process_dict)
+
+
+def remember_backend_values(keys, backend_dict):
+    """ Keeps values got from cache backend for given keys in request cache.
+    """
+    request_cache = get_request_cache()
+    if request_cache is not None:
+        request_cache.set_many({key: value
+            for key, value in backend_dict.items()
+            if not isinstance(value, StaleData)})
+        request_cache.set_absent(
+            [key for key in keys if key not in backend_dict])
+
+
+def split_stale_data(d, pending_keys):
+    """ Returns dict of values and dict of StaleData of keys in d.
+    """
+    if pending_keys:
+        # keys invalidated in open transaction are treated as just
+        # invalidated, so that values are got from db and not cached
+        stale_data = StaleData(time.time())
+        for key in pending_keys:
+            d[key] = stale_data
+
     result_dict = {}
     stale_data_dict = {}
 
@@ -110,11 +199,335 @@ def cache_get_many(keys):
     return result_dict, stale_data_dict
 
 
+class CacheWriteBatch(object):
+    """ Collects writes to cache to make them together.
+
+        Writes are made on flush in order: sets (using set_many),
+        adds (using add_many) and then deletes.
+    """
+    def __init__(self):
+        self.set_dicts = defaultdict(dict)
+        self.add_dicts = defaultdict(dict)
+        self.delete_keys = []
+
+    def set(self, key, value, timeout):
+        self.add_dicts[timeout].pop(key, None)
+        self.set_dicts[timeout][key] = value
+
+    def add(self, key, value, timeout):
+        if key in self.set_dicts[timeout]:
+            return
+        self.add_dicts[timeout].setdefault(key, value)
+
+    def delete(self, key):
+        self.delete_keys.append(key)
+
+    def flush(self):
+        set_dicts, self.set_dicts = self.set_dicts, defaultdict(dict)
+        add_dicts, self.add_dicts = self.add_dicts, defaultdict(dict)
+        delete_keys, self.delete_keys = self.delete_keys, []
+        for timeout, key_value_dict in set_dicts.items():
+            if key_value_dict:
+                cache.set_many(key_value_dict, timeout=timeout)
+        for timeout, key_value_dict in add_dicts.items():
+            if key_value_dict:
+                cache_add_many(key_value_dict, timeout=timeout)
+        if delete_keys:
+            cache.delete_many(delete_keys)
+
+
+_write_batch_local = threading.local()
+
+
+def get_write_batch():
+    """ Returns the write batch active in current thread or None
+    """
+    return getattr(_write_batch_local, 'write_batch', None)
+
+
+@contextmanager
+def batch_cache_writes():
+    """ Context manager to make all cache writes done inside it together
+    when it exits. If a write batch is already active then it's reused.
+    """
+    write_batch = get_write_batch()
+    if write_batch is not None:
+        yield write_batch
+        return
+    write_batch = CacheWriteBatch()
+    _write_batch_local.write_batch = write_batch
+    try:
+        yield write_batch
+    finally:
+        _write_batch_local.write_batch = None
+        write_batch.flush()
+
+
+def cache_add_many(key_value_dict, timeout):
+    """ Adds all given key values to cache which are not already there.
+
+    Uses backend client's add_multi (E.g. pylibmc) in single call if it is
+    available else adds keys one by one.
+    """
+    client = getattr(cache, '_cache', None)
+    add_multi = getattr(client, 'add_multi', None)
+    if add_multi is None:
+        for key, value in key_value_dict.items():
+            cache.add(key, value, timeout=timeout)
+        return
+    add_multi(dict((cache.make_key(key), value)
+                   for key, value in key_value_dict.items()),
+              time=cache.get_backend_timeout(timeout))
+
+
+class EmulatedCAS(object):
+    """ Compare-and-set emulated by reading the value again just before
+    setting it. Used when cache client doesn't support cas (E.g. locmem).
+
+    The value itself is used as cas token.
+    """
+    lock = threading.Lock()
+
+    def gets_many(self, keys):
+        """ Returns dict of key and (value, cas_token) pair
+        """
+        return dict((key, (value, value))
+                    for key, value in cache.get_many(keys).items())
+
+    def cas(self, key, value, cas_token, timeout):
+        """ Sets the value if value in cache is still the one got with
+        cas_token. Returns whether value got set.
+        """
+        with self.lock:
+            if cache.get(key) != cas_token:
+                return False
+            cache.set(key, value, timeout=timeout)
+            return True
+
+
+class EmulatedCASToken(object):
+    def __init__(self, value):
+        self.value = value
+
+
+class ClientCAS(object):
+    """ Compare-and-set using gets/cas of memcached client
+    (pylibmc or pymemcache).
+    """
+    def __init__(self, client):
+        self.client = client
+        self.emulated_cas = EmulatedCAS()
+
+    def gets_many(self, keys):
+        backend_keys = dict((cache.make_key(key), key) for key in keys)
+        gets_many = getattr(self.client, 'gets_many', None)
+        if gets_many is not None:
+            backend_dict = gets_many(list(backend_keys))
+        else:
+            backend_dict = {}
+            for backend_key in backend_keys:
+                backend_dict[backend_key] = self.client.gets(backend_key)
+        result_dict = {}
+        for backend_key, (value, cas_token) in backend_dict.items():
+            if value is None:
+                continue
+            if cas_token is None:
+                # cas is not enabled on client, emulate it
+                cas_token = EmulatedCASToken(value)
+            result_dict[backend_keys[backend_key]] = (value, cas_token)
+        return result_dict
+
+    def cas(self, key, value, cas_token, timeout):
+        if isinstance(cas_token, EmulatedCASToken):
+            return self.emulated_cas.cas(key, value, cas_token.value, timeout)
+        return bool(self.client.cas(cache.make_key(key), value, cas_token,
+                                    cache.get_backend_timeout(timeout)))
+
+
+_cache_cas = []
+
+def get_cache_cas():
+    """ Returns ClientCAS if cache client supports cas else EmulatedCAS
+    """
+    if not _cache_cas:
+        client = getattr(cache, '_cache', None)
+        client_module = type(client).__module__.split('.')[0]
+        if (client_module in ('pylibmc', '_pylibmc', 'pymemcache') and
+                hasattr(client, 'gets') and hasattr(client, 'cas')):
+            _cache_cas.append(ClientCAS(client))
+        else:
+            _cache_cas.append(EmulatedCAS())
+    return _cache_cas[0]
+
+
+def cache_set(key, value, timeout):
+    write_batch = get_write_batch()
+    if write_batch is not None:
+        write_batch.set(key, value, timeout)
+    else:
+        cache.set(key, value, timeout=timeout)
+
+
+def cache_add(key, value, timeout):
+    write_batch = get_write_batch()
+    if write_batch is not None:
+        write_batch.add(key, value, timeout)
+    else:
+        cache.add(key, value, timeout=timeout)
+
+
+def cache_delete(key):
+    write_batch = get_write_batch()
+    if write_batch is not None:
+        write_batch.delete(key)
+    else:
+        cache.delete(key)
+
+
+# generations of cache classes having use_generation, as last seen by this
+# process
+generations = {}
+
+
+def refresh_generations(cache_classes):
+    """ Gets current generations of given cache classes from cache in a
+    single call.
+    """
+    key_class_dict = dict((cache_class.get_generation_key(), cache_class)
+                          for cache_class in cache_classes)
+    if not key_class_dict:
+        return
+    result_dict = cache.get_many(list(key_class_dict.keys()))
+    for key, cache_class in key_class_dict.items():
+        generation = result_dict.get(key)
+        if generation is None:
+            generation = init_generation(cache_class)
+        generations[cache_class] = generation
+
+
+def init_generation(cache_class):
+    """ Sets generation of class in cache if it is not there (new class or
+    evicted key) and returns the generation in cache.
+
+    Generations start from current time so that keys of earlier generations
+    don't get used again.
+    """
+    key = cache_class.get_generation_key()
+    generation = int(time.time() * 1000)
+    if not cache.add(key, generation, timeout=None):
+        generation = cache.get(key, generation)
+    return generation
+
+
+def get_flight_key(cache_keys, stale_data_dict):
+    """ Returns the key on which getting value from fallback method can be
+    shared with other threads (see resolve_once), which is the key of value
+    (first of cache_keys).
+
+    None is returned if any of cache_keys is found invalidated, as value
+    being got by a thread which started before the invalidation may be
+    older than the change which invalidated it.
+    """
+    if any(cache_key in stale_data_dict for cache_key in cache_keys):
+        return None
+    return cache_keys[0]
+
+
+class Fallback(object):
+    """ Yielded by get_coroutine when value is not found in cache.
+        The driver of coroutine has to send back the value got from
+        fallback method (get_value_for_params) of cache query.
+    """
+    def __repr__(self):
+        return 'FALLBACK'
+
+FALLBACK = Fallback()
+
+
+class LeaseWait(object):
+    """ Yielded by get_coroutine when value is not found in cache and
+        some other process holds the lease to get it. The driver of
+        coroutine may wait for value to be set in cache (see
+        wait_for_leased_values) or send None to get it from fallback method.
+    """
+    def __repr__(self):
+        return 'LEASE_WAIT'
+
+LEASE_WAIT = LeaseWait()
+
+
+def wait_for_leased_values(leased_dict):
+    """ Polls cache for values being got by processes holding leases
+    on them.
+
+    leased_dict is dict of some id and (cache_query, cache_keys) pair where
+    first of cache_keys is the key of value. Returns dict of id and
+    (result_dict, stale_data_dict) pair of all cache_keys for values which
+    got set in cache within lease_timeout of their cache_query.
+    """
+    found_dict = {}
+    pending_dict = dict(leased_dict)
+    start_time = time.time()
+    while pending_dict:
+        time.sleep(get_lease_poll_interval(pending_dict))
+        d = cache.get_many(get_leased_cache_keys(pending_dict))
+        collect_leased_values(pending_dict, d, found_dict,
+                              time.time() - start_time)
+    remember_leased_values(found_dict)
+    return found_dict
+
+
+def get_lease_poll_interval(pending_dict):
+    return min(cache_query.lease_poll_interval
+               for cache_query, _ in pending_dict.values())
+
+
+def get_leased_cache_keys(pending_dict):
+    all_cache_keys = set()
+    for _, cache_keys in pending_dict.values():
+        all_cache_keys.update(cache_keys)
+    return list(all_cache_keys)
+
+
+def collect_leased_values(pending_dict, d, found_dict, waited):
+    """ Moves entries of pending_dict whose values are found in d (got from
+    cache) to found_dict, and drops the ones waited for longer than lease
+    timeout of their cache query.
+    """
+    for id_, (cache_query, cache_keys) in list(pending_dict.items()):
+        if cache_keys[0] in d and not isinstance(
+                d[cache_keys[0]], StaleData):
+            result_dict = {}
+            stale_data_dict = {}
+            for cache_key in cache_keys:
+                if cache_key not in d:
+                    continue
+                if isinstance(d[cache_key], StaleData):
+                    stale_data_dict[cache_key] = d[cache_key]
+                else:
+                    result_dict[cache_key] = d[cache_key]
+            found_dict[id_] = (result_dict, stale_data_dict)
+            del pending_dict[id_]
+        elif waited >= cache_query.lease_timeout:
+            del pending_dict[id_]
+
+
+def remember_leased_values(found_dict):
+    request_cache = get_request_cache()
+    if request_cache is not None:
+        for result_dict, _ in found_dict.values():
+            request_cache.set_many(result_dict)
+
+
 class InvalidationType(object):
     OFF = 0
     UNSET = 1
+    # saved instance is written to keys of InstanceCache classes, others
+    # are unset
     RESET = 2
     DYNAMIC = 3
+    # like DYNAMIC but stale value is returned and refreshed in background
+    REVALIDATE = 4
 
 USING_KWARG = '__using'
 
@@ -135,7 +548,7 @@ class Cache(six.with_metaclass(ABCMeta, object)):
         as metaclass to achieve above constraints.
     """
     # Derived class may provide serializer (E.g. for compression)
-    serializer = None
+    serializer = get_default_serializer()
 
     # default version
     version = 0
@@ -149,12 +562,63 @@ class Cache(six.with_metaclass(ABCMeta, object)):
     # default allowtime
     allowtime = None
 
+    # When a key is not found in cache, the process getting its value takes
+    # a lease on it for lease_timeout seconds (integer). Others poll cache
+    # for the value every lease_poll_interval seconds meanwhile instead of
+    # going to fallback method. None means no lease is taken.
+    lease_timeout = flash_settings.LEASE_TIMEOUT
+    lease_poll_interval = flash_settings.LEASE_POLL_INTERVAL
+
+    # number of seconds for which fresh values are also kept in memory of
+    # the process. None means values are not kept.
+    process_cache_timeout = None
+
+    # Whether keys of the class include its generation kept in cache, so
+    # that all of them get invalidated at once by bump_generation. Keys
+    # built by get_key of model cache classes include it, classes
+    # overriding get_key have to include get_generation() themselves.
+    use_generation = False
+
     cache_type = 'SimpleCache'
 
     def __init__(self, *args, **kwargs):
         self.args = args
         self.kwargs = kwargs
 
+    @classmethod
+    def get_generation_key(cls):
+        return memcache_key_escape('%s__%s__generation' % (
+            cls.cache_type, cls.__name__))
+
+    @classmethod
+    def get_generation(cls):
+        """ Returns generation of the class last seen by this process.
+        """
+        generation = generations.get(cls)
+        if generation is None:
+            refresh_generations([cls])
+            generation = generations[cls]
+        return generation
+
+    @classmethod
+    def bump_generation(cls):
+        """ Invalidates all keys of the class by moving it to the next
+        generation. Other processes see it on their next get of the class.
+        """
+        key = cls.get_generation_key()
+        try:
+            generation = cache.incr(key)
+        except ValueError:
+            # key is not in cache
+            generation = init_generation(cls)
+        generations[cls] = generation
+        request_cache = get_request_cache()
+        if request_cache is not None:
+            request_cache.set_many({key: generation})
+        for related_cache in getattr(cls, 'related_caches', {}).values():
+            related_cache.bump_generation()
+        return generation
+
     @property
     def key(self):
         return self.get_key(*self.args, **self.kwargs)
@@ -174,6 +638,10 @@ class Cache(six.with_metaclass(ABCMeta, object)):
     def get_stale_key(key):
         return key + '__stale'
 
+    @staticmethod
+    def get_key_of_stale_key(stale_key):
+        return stale_key[:-len('__stale')]
+
     def to_cache_value(self, value):
         if self.serializer:
             value = self.serializer.dumps(value)
@@ -195,7 +663,19 @@ class Cache(six.with_metaclass(ABCMeta, object)):
 
     def release_write_lock(self, key):
         write_lock_key = self.get_write_lock_key(key)
-        return cache.delete(write_lock_key)
+        return cache_delete(write_lock_key)
+
+    @staticmethod
+    def get_lease_key(key):
+        return key + '__lease'
+
+    def try_acquire_lease(self, key):
+        lease_key = self.get_lease_key(key)
+        return cache.add(lease_key, True, timeout=self.lease_timeout)
+
+    def release_lease(self, key):
+        lease_key = self.get_lease_key(key)
+        return cache_delete(lease_key)
 
     def get_option_value_from_cache_coroutine(self, key, extra_keys=None,
             key_value_dict=None):
@@ -230,10 +710,18 @@ class Cache(six.with_metaclass(ABCMeta, object)):
             return
 
         value = result_dict[key]
-        if isinstance(value, WrappedValue):
-            value.value = self.from_cache_value(value.value)
-        else:
-            value = self.from_cache_value(value)
+        try:
+            if isinstance(value, WrappedValue):
+                # Don't modify the fetched value in place as it may be shared
+                # through request cache.
+                value = WrappedValue(self.from_cache_value(value.value),
+                                     value.version, value.timestamp)
+            else:
+                value = self.from_cache_value(value)
+        except SchemaChanged:
+            # value was cached before the model was changed
+            yield None
+            return
         yield Some(value)
 
     @abstractmethod
@@ -243,6 +731,45 @@ class Cache(six.with_metaclass(ABCMeta, object)):
         """
         pass
 
+    def get_values_for_params_list(self, params_list):
+        """ Returns the list of values for given list of (args, kwargs)
+        pairs. Used when values of many cache queries of a class are to be
+        got from fallback method together.
+
+        Derived class can override it to get all values in lesser number of
+        queries.
+        """
+        return [self.get_value_for_params(*args, **kwargs)
+                for args, kwargs in params_list]
+
+    def get_results_for_params_list(self, params_list):
+        """ Returns the list of (is_exception, value or exception) pairs for
+        given list of (args, kwargs) pairs, so that failure of some params
+        doesn't fail the others.
+
+        Values are got together using get_values_for_params_list. If it
+        fails, they are got one by one so that exception is assosiated with
+        only the params which raised it. Derived class getting values
+        together can override it to return exceptions of some params along
+        with values of others.
+        """
+        if len(params_list) > 1:
+            try:
+                values = self.get_values_for_params_list(params_list)
+                return [(False, value) for value in values]
+            except Exception:
+                pass
+        return [self.get_result_for_params(args, kwargs)
+                for args, kwargs in params_list]
+
+    def get_result_for_params(self, args, kwargs):
+        """ Returns (is_exception, value or exception) pair for given params
+        """
+        try:
+            return (False, self.get_value_for_params(*args, **kwargs))
+        except Exception as e:
+            return (True, e)
+
     def get_extra_keys(self, *args, **kwargs):
         pass
 
@@ -272,20 +799,43 @@ class Cache(six.with_metaclass(ABCMeta, object)):
             key_value_dict = {}
         key_value_dict[key] = value
 
-        for key_, value_ in key_value_dict.items():
-            if key_ in stale_data_dict:
-                current_value_dict = cache.get_many([key_])
-                if key_ in current_value_dict:
-                    current_value = current_value_dict[key_]
-                    stale_value = stale_data_dict[key_]
-                    if (isinstance(current_value, StaleData) and
-                            current_value.timestamp == stale_value.timestamp):
-                        cache.set(key_, value_, timeout=self.timeout)
+        stale_keys = [key_ for key_ in key_value_dict
+                      if key_ in stale_data_dict]
+        if stale_keys:
+            # Set the stale keys only if they are not changed after they were
+            # found stale. All of them are read in single call.
+            cache_cas = get_cache_cas()
+            current_value_dict = cache_cas.gets_many(stale_keys)
+            for key_ in stale_keys:
+                value_ = key_value_dict[key_]
+                if key_ not in current_value_dict:
                     continue
-            if force_update:
-                cache.set(key_, value_, timeout=self.timeout)
-            else:
-                cache.add(key_, value_, timeout=self.timeout)
+                current_value, cas_token = current_value_dict[key_]
+                if current_value == stale_data_dict[key_]:
+                    if cache_cas.cas(key_, value_, cas_token, self.timeout):
+                        self._remember(key_, value_)
+
+        # all other key values are written together
+        with batch_cache_writes():
+            for key_, value_ in key_value_dict.items():
+                if key_ in stale_data_dict:
+                    continue
+                if force_update:
+                    cache_set(key_, value_, self.timeout)
+                else:
+                    cache_add(key_, value_, self.timeout)
+                self._remember(key_, value_)
+
+    def _remember(self, key, value):
+        """ Keeps the value just set in cache in request cache and
+        process cache.
+        """
+        request_cache = get_request_cache()
+        if request_cache is not None:
+            request_cache.set_many({key: value})
+        if self.process_cache_timeout and isinstance(value, WrappedValue):
+            process_cache.set(key, value, self.process_cache_timeout,
+                              type(self))
 
     def get_coroutine(self, *args, **kwargs):
         """ Yields the value for given params (args and kwargs).
@@ -293,25 +843,55 @@ class Cache(six.with_metaclass(ABCMeta, object)):
         First tries to get it from cache. If not found, gets it from
         fallback method and sets the value to cache.
         """
+        if self.use_generation:
+            # keys of related caches of select_related are got along and
+            # include generations of those classes
+            generation_classes = [type(self)] + [
+                    self.related_caches[relation]
+                    for relation in getattr(self, 'select_related', [])]
+            class_generations = [(cache_class, cache_class.get_generation())
+                                 for cache_class in generation_classes]
         key = self.get_key(*args, **kwargs)
 
-        is_invalidation_dynamic = (
-                self.invalidation == InvalidationType.DYNAMIC)
+        is_invalidation_dynamic = self.invalidation in [
+                InvalidationType.DYNAMIC, InvalidationType.REVALIDATE]
         extra_keys = self.get_extra_keys(*args, **kwargs) or []
         if is_invalidation_dynamic:
             stale_key = self.get_stale_key(key)
             extra_keys.append(stale_key)
+        if self.use_generation:
+            # current generations are got along with the value
+            extra_keys.extend(cache_class.get_generation_key()
+                              for cache_class in generation_classes)
         key_value_dict = {}
 
         coroutine = self.get_option_value_from_cache_coroutine(key, extra_keys,
                 key_value_dict)
         keys = coroutine.send(None)
         result_dict, stale_data_dict = yield keys
+        if self.use_generation:
+            generation_changed = False
+            for cache_class, generation in class_generations:
+                current_generation = result_dict.get(
+                        cache_class.get_generation_key())
+                if current_generation != generation:
+                    if current_generation is None:
+                        current_generation = init_generation(cache_class)
+                    generations[cache_class] = current_generation
+                    generation_changed = True
+            if generation_changed:
+                # class has moved to another generation, values got for keys
+                # of older generation are not to be used
+                key = self.get_key(*args, **kwargs)
+                if is_invalidation_dynamic:
+                    stale_key = self.get_stale_key(key)
+                result_dict, stale_data_dict = {}, {}
         option_value = coroutine.send(result_dict)
 
         return_cache_value = False
         lock_acquired = False
-        force_update = False
+        # value present in cache which couldn't be loaded has to be replaced
+        force_update = option_value is None and key in result_dict
         if option_value is not None:
             # cache found in cache
             w_value = option_value.unwrap()
@@ -326,7 +906,8 @@ class Cache(six.with_metaclass(ABCMeta, object)):
                         current_dynamic_version != w_value.version):
                     if self.invalidation in [
                             InvalidationType.OFF,
-                            InvalidationType.DYNAMIC]:
+                            InvalidationType.DYNAMIC,
+                            InvalidationType.REVALIDATE]:
                         try_acquire_lock = True
                     else:
                         force_update = True
@@ -343,10 +924,21 @@ class Cache(six.with_metaclass(ABCMeta, object)):
                     return_cache_value = True
                 else:
                     force_update = True
+                if return_cache_value and self.process_cache_timeout:
+                    # keep the fresh value fetched from cache in process
+                    process_cache.set(key, result_dict[key],
+                                      self.process_cache_timeout, type(self),
+                                      add=True)
                 if try_acquire_lock:
                     lock_acquired = self.try_acquire_write_lock(key)
                     if not lock_acquired:
                         return_cache_value = True
+                    elif (self.invalidation == InvalidationType.REVALIDATE
+                            and refresh_pool.submit(
+                                self.refresh, key, args, kwargs)):
+                        # refresh releases the lock
+                        lock_acquired = False
+                        return_cache_value = True
                     else:
                         force_update = True
             else:
@@ -354,35 +946,57 @@ class Cache(six.with_metaclass(ABCMeta, object)):
                 return_cache_value = True
 
         if not return_cache_value:
-            # get value using fallback method (e.g. db)
-            value = self.get_value_for_params(*args, **kwargs)
-            if not isinstance(value, DontCache):
-                key_value_dict = self.get_extra_key_value_dict(
-                        value, *args, **kwargs)
-
-                set_value_in_cache = True
-                if (option_value is None and key in stale_data_dict and
-                        (time.time() - stale_data_dict[key].timestamp) < 0.3):
-                    # cache was just invalidated
-                    # db may return stale data
-                    # hence
-                    set_value_in_cache = False
-
-                if StrictVersion(django.get_version()) < StrictVersion('1.7'):
-                    transaction.commit_unless_managed()
-
-                value = self.pre_set_process_value(value, *args, **kwargs)
-
-                # set the key value in cache
-                if set_value_in_cache:
-                    self._set(key, value, key_value_dict, stale_data_dict,
-                          force_update=force_update)
-
-                if is_invalidation_dynamic:
-                    cache.delete(stale_key)
-
+            set_value_in_cache = True
+            if (option_value is None and key in stale_data_dict and
+                    (time.time() - stale_data_dict[key].timestamp) <
+                    flash_settings.STALE_DATA_WINDOW):
+                # cache was just invalidated
+                # db may return stale data
+                # hence
+                set_value_in_cache = False
+
+            lease_acquired = False
+            try:
+                if (option_value is None and set_value_in_cache and
+                        self.lease_timeout):
+                    lease_acquired = self.try_acquire_lease(key)
+                    if not lease_acquired:
+                        # Other process is getting the value. Driver of
+                        # coroutine may wait for it, else it sends None to
+                        # continue.
+                        yield LEASE_WAIT
+
+                # get value using fallback method (e.g. db)
+                # driver of coroutine sends it back
+                value = yield FALLBACK
+                if not isinstance(value, DontCache):
+                    key_value_dict = self.get_extra_key_value_dict(
+                            value, *args, **kwargs)
+
+                    if (StrictVersion(django.get_version()) <
+                            StrictVersion('1.7')):
+                        transaction.commit_unless_managed()
+
+                    value = self.pre_set_process_value(
+                            value, *args, **kwargs)
+
+                    # set the key value in cache
+                    if set_value_in_cache:
+                        self._set(key, value, key_value_dict,
+                                  stale_data_dict, force_update=force_update)
+
+                    if is_invalidation_dynamic:
+                        cache_delete(stale_key)
+                        request_cache = get_request_cache()
+                        if request_cache is not None:
+                            request_cache.set_absent([stale_key])
+            finally:
+                # also when fallback method fails or driver of coroutine
+                # closes it without sending the value
                 if lock_acquired:
                     self.release_write_lock(key)
+                if lease_acquired:
+                    self.release_lease(key)
 
         if isinstance(value, DontCache):
             value = value.inner_val
@@ -391,6 +1005,24 @@ class Cache(six.with_metaclass(ABCMeta, object)):
                 value, key_value_dict, *args, **kwargs)
         yield value
 
+    def refresh(self, key, args, kwargs):
+        """ Sets the value got from fallback method in cache and releases
+        the write lock on key. Called in background for stale values of
+        caches with REVALIDATE invalidation.
+        """
+        try:
+            # Remove the stale mark before getting the value so that
+            # invalidation happening meanwhile is not lost.
+            cache_delete(self.get_stale_key(key))
+            value = self.get_value_for_params(*args, **kwargs)
+            if not isinstance(value, DontCache):
+                key_value_dict = self.get_extra_key_value_dict(
+                        value, *args, **kwargs)
+                value = self.pre_set_process_value(value, *args, **kwargs)
+                self._set(key, value, key_value_dict, force_update=True)
+        finally:
+            self.release_write_lock(key)
+
     def resolve_coroutine(self):
         return self.get_coroutine(*self.args, **self.kwargs)
 
@@ -404,6 +1036,31 @@ class Cache(six.with_metaclass(ABCMeta, object)):
         else:
             result_dict, stale_data_dict = cache_get_many(keys)
         value = coroutine.send((result_dict, stale_data_dict))
+        if value is LEASE_WAIT:
+            found_dict = wait_for_leased_values({None: (self, keys)})
+            if None in found_dict:
+                # start again with the value set by lease holder
+                coroutine = self.get_coroutine(*args, **kwargs)
+                coroutine.send(None)
+                value = coroutine.send(found_dict[None])
+            if value is LEASE_WAIT:
+                value = coroutine.send(None)
+        if value is FALLBACK:
+            def resolve(indexes):
+                try:
+                    return [(False, self.get_value_for_params(
+                        *args, **kwargs))]
+                except Exception as e:
+                    return [(True, e)]
+            (is_exception, fallback_value), = resolve_once(
+                    [get_flight_key(keys, stale_data_dict)], resolve,
+                    getattr(self, 'using', None))
+            if is_exception:
+                # releases lease and lock taken by coroutine
+                coroutine.close()
+                raise fallback_value
+            with batch_cache_writes():
+                value = coroutine.send(fallback_value)
         return value
 
     def resolve(self):
@@ -430,12 +1087,20 @@ class Cache(six.with_metaclass(ABCMeta, object)):
             value = self.pre_set_process_value(value, **params)
         self._set(key, value, force_update=True)
 
-    def resolve_async(self):
-        from .loader import FlashCacheLoader
-        from thread_context.dataloader_context import DataLoadersFactory
+    def aget(self, *args, **kwargs):
+        """ Awaitable counterpart of get method
+        """
+        return type(self)(*args, **kwargs).aresolve()
 
-        loader = DataLoadersFactory.get_loader_for(FlashCacheLoader)
-        return loader.load(self)
+    def aresolve(self):
+        """ Returns future of the value, which is got along with other cache
+        queries awaited at the same time without blocking the event loop.
+        """
+        from .aio import load
+        return load(self)
+
+    def resolve_async(self):
+        return self.aresolve()
 
 
 class BatchCacheQuery(object):
@@ -454,48 +1119,260 @@ class BatchCacheQuery(object):
             self.queries.update(kwargs)
 
     def get(self, only_cache=False, none_on_exception=False,
-            return_exceptions=False):
+            return_exceptions=False, parallel=None):
+        """ Returns dict of keys of queries and their values.
+
+        With parallel, values of queries of different cache classes or dbs
+        not found in cache are got from fallback methods concurrently.
+        FLASH_PARALLEL_FALLBACKS is its default.
+        """
+        if parallel is None:
+            parallel = flash_settings.PARALLEL_FALLBACKS
+        coroutine = self.get_coroutine(only_cache, none_on_exception,
+                                       return_exceptions)
+        all_cache_keys = coroutine.send(None)
+        if flash_settings.DONT_USE_CACHE:
+            result = {}, {}
+        else:
+            result = cache_get_many(all_cache_keys)
+        leased_dict = coroutine.send(result)
+        found_dict = {}
+        if leased_dict:
+            found_dict = wait_for_leased_values(leased_dict)
+        fallback_groups = coroutine.send(found_dict)
+        # values of all queries are set in cache together
+        with batch_cache_writes():
+            results_list = self.resolve_fallback_groups(fallback_groups,
+                                                        parallel)
+            return coroutine.send(results_list)
+
+    def aget(self, only_cache=False, none_on_exception=False,
+             return_exceptions=False):
+        """ Awaitable counterpart of get method, which doesn't block the
+        event loop while getting values from cache and fallback methods.
+        """
+        from flash.aio import get_batch_query_async
+        return get_batch_query_async(self, only_cache, none_on_exception,
+                                     return_exceptions)
+
+    def get_coroutine(self, only_cache=False, none_on_exception=False,
+                      return_exceptions=False):
+        """ Yields the values of queries, leaving the calls to cache and
+        fallback methods to the driver of coroutine. In order it
+
+        - yields list of keys to be got from cache and gets back
+          (result_dict, stale_data_dict) pair for them.
+        - yields leased_dict (see wait_for_leased_values) and gets back
+          dict of values found for it.
+        - yields list of (flight keys, cache queries, using) of queries whose
+          values are to be got from fallback methods, grouped on their cache
+          class and db, and gets back list of results of each group (see
+          resolve_fallback_group).
+        - yields dict of keys of queries and their values.
+        """
         all_cache_keys = set()
         coroutines_dict = {}
         value_dict = {}
 
+        def store_exception(key, e):
+            if return_exceptions:
+                value_dict[key] = e
+            elif none_on_exception:
+                value_dict[key] = None
+            else:
+                return False
+            return True
+
         for key, cache_query in self.queries.items():
             coroutine = cache_query.resolve_coroutine()
             cache_keys = coroutine.send(None)
             all_cache_keys.update(cache_keys)
             coroutines_dict[key] = (coroutine, cache_keys)
 
-        all_cache_keys = list(all_cache_keys)
-        all_cache_result, all_stale_data_dict = cache_get_many(all_cache_keys)
+        def close_coroutines():
+            # releases leases and locks taken by coroutines of queries whose
+            # values are not got (E.g. fallback method failed)
+            for coroutine, _ in coroutines_dict.values():
+                coroutine.close()
 
-        for key in coroutines_dict:
-            coroutine, cache_keys = coroutines_dict[key]
-            result_dict = {}
-            stale_data_dict = {}
+        try:
+            all_cache_result, all_stale_data_dict = yield list(all_cache_keys)
+
+            # keys of queries whose values are to be got from fallback method,
+            # grouped on their cache class and db.
+            fallback_groups = defaultdict(list)
+            # keys of queries whose values are being got by other processes
+            leased_dict = {}
+
+            def handle_value(key, value):
+                if value is LEASE_WAIT:
+                    if not only_cache:
+                        leased_dict[key] = (self.queries[key],
+                                            coroutines_dict[key][1])
+                elif value is FALLBACK:
+                    if not only_cache:
+                        cache_query = self.queries[key]
+                        group_key = (type(cache_query),
+                                     getattr(cache_query, 'using', None))
+                        fallback_groups[group_key].append(key)
+                else:
+                    value_dict[key] = value
+
+            for key in coroutines_dict:
+                coroutine, cache_keys = coroutines_dict[key]
+                result_dict = {}
+                stale_data_dict = {}
+
+                to_continue = False
+                for cache_key in cache_keys:
+                    if cache_key in all_cache_result:
+                        result_dict[cache_key] = all_cache_result[cache_key]
+                    elif only_cache:
+                        to_continue = True
+                        break
+                    elif cache_key in all_stale_data_dict:
+                        stale_data_dict[cache_key] = (
+                            all_stale_data_dict[cache_key])
+                if to_continue:
+                    continue
 
-            to_continue = False
-            for cache_key in cache_keys:
-                if cache_key in all_cache_result:
-                    result_dict[cache_key] = all_cache_result[cache_key]
-                elif only_cache:
-                    to_continue = True
-                    break
-                elif cache_key in all_stale_data_dict:
-                    stale_data_dict[cache_key] = all_stale_data_dict[cache_key]
-            if to_continue:
-                continue
+                try:
+                    handle_value(key, coroutine.send(
+                        (result_dict, stale_data_dict)))
+                except Exception as e:
+                    if not store_exception(key, e):
+                        raise
+
+            found_dict = yield leased_dict
+            for key in leased_dict:
+                try:
+                    if key in found_dict:
+                        # start again with the value set by lease holder
+                        coroutines_dict[key][0].close()
+                        coroutine = self.queries[key].resolve_coroutine()
+                        coroutine.send(None)
+                        coroutines_dict[key] = (coroutine,
+                                                coroutines_dict[key][1])
+                        value = coroutine.send(found_dict[key])
+                    else:
+                        value = LEASE_WAIT
+                    if value is LEASE_WAIT:
+                        value = coroutines_dict[key][0].send(None)
+                    handle_value(key, value)
+                except Exception as e:
+                    if not store_exception(key, e):
+                        raise
+
+            group_keys_list = list(fallback_groups.values())
+            results_list = yield [
+                ([get_flight_key(coroutines_dict[key][1], all_stale_data_dict)
+                  for key in keys],
+                 [self.queries[key] for key in keys],
+                 using)
+                for (_, using), keys in fallback_groups.items()]
+            for keys, results in zip(group_keys_list, results_list):
+                for key, (is_exception, result) in zip(keys, results):
+                    coroutine = coroutines_dict[key][0]
+                    try:
+                        if is_exception:
+                            raise result
+                        value_dict[key] = coroutine.send(result)
+                    except Exception as e:
+                        if not store_exception(key, e):
+                            raise
+        except BaseException:
+            close_coroutines()
+            raise
+        close_coroutines()
+        yield value_dict
 
-            try:
-                value = coroutine.send((result_dict, stale_data_dict))
-                value_dict[key] = value
-            except Exception as e:
-                if return_exceptions:
-                    value_dict[key] = e
-                elif none_on_exception:
-                    value_dict[key] = None
-                else:
-                    raise
-        return value_dict
+    @classmethod
+    def resolve_fallback_groups(cls, fallback_groups, parallel=False):
+        """ Returns list of results of resolve_fallback_group for given
+        groups.
+
+        With parallel, groups other than the first are resolved in threads
+        of fallback pool, each using its own db connections. It's not done
+        inside transactions, so that their uncommitted changes are seen,
+        and inside threads of the pool, so that they don't wait for each
+        other.
+        """
+        if (not parallel or len(fallback_groups) < 2 or
+                fallback_pool.in_worker() or
+                any(transaction.get_connection(
+                        using or DEFAULT_DB_ALIAS).in_atomic_block
+                    for _, _, using in fallback_groups)):
+            return [cls.resolve_fallback_group(*fallback_group)
+                    for fallback_group in fallback_groups]
+        futures = [fallback_pool.submit(cls.resolve_fallback_group,
+                                        *fallback_group)
+                   for fallback_group in fallback_groups[1:]]
+        results_list = [cls.resolve_fallback_group(*fallback_groups[0])]
+        results_list.extend(future.result() for future in futures)
+        return results_list
+
+    @classmethod
+    def resolve_fallback_group(cls, flight_keys, cache_queries, using):
+        """ Returns list of (is_exception, value or exception) pairs got from
+        fallback method for given cache queries of same class and db, whose
+        values are not being got by other threads at the same time.
+        """
+        return resolve_once(
+            flight_keys,
+            lambda indexes: cls.resolve_fallbacks(
+                [cache_queries[i] for i in indexes]),
+            using)
+
+    @staticmethod
+    def resolve_fallbacks(cache_queries):
+        """ Returns list of (is_exception, value or exception) pairs got from
+        fallback method for given cache queries of same class and db, using
+        get_results_for_params_list of the class.
+        """
+        params_list = [(cache_query.args, cache_query.kwargs)
+                       for cache_query in cache_queries]
+        return cache_queries[0].get_results_for_params_list(params_list)
+
+
+class InvalidationStep(namedtuple('InvalidationStep', [
+        'cache_class', 'is_dynamic', 'key_attnames', 'needs_db_lookup',
+        'depends_on_attnames'])):
+    """ What to do for a cache class when an instance of a model changes.
+
+        cache_class: class whose keys are to be invalidated
+        is_dynamic: whether stale keys are to be set instead of keys
+        key_attnames: attnames of the model in order of key fields if keys
+            can be built right from values of the instance, else None and
+            keys are got from get_keys_to_be_invalidated of cache_class.
+        needs_db_lookup: whether keys are found by querying cache_class's
+            model through its rel_models.
+        depends_on_attnames: frozenset of attnames of the model whose
+            change can change cached values, None if any change can.
+    """
+    __slots__ = ()
+
+
+def get_invalidation_attnames(model):
+    """ Returns attnames of model whose values are enough to get keys to be
+    invalidated when its instances change. Returns None if a cache class
+    has its own way of getting keys to be invalidated and may need other
+    values.
+    """
+    attnames = [model._meta.pk.attname]
+    for step in BaseModelQueryCacheMeta.invalidation_plans.get(model, ()):
+        cache_class = step.cache_class
+        if cache_class.invalidation == InvalidationType.OFF:
+            continue
+        if not (cache_class.uses_default_invalidation() or
+                cache_class.uses_default_related_invalidation()):
+            return None
+        step_attnames = list(step.depends_on_attnames or [])
+        if cache_class.model is model:
+            step_attnames.extend(cache_class.get_key_fields_attnames())
+        for attname in step_attnames:
+            if attname not in attnames:
+                attnames.append(attname)
+    return attnames
 
 
 class BaseModelQueryCacheMeta(ABCMeta):
@@ -506,6 +1383,11 @@ class BaseModelQueryCacheMeta(ABCMeta):
     """
     model_caches = defaultdict(list)
     model_caches_on_target_model = defaultdict(list)
+    # tuple of InvalidationStep of each cache class in model_caches of model
+    invalidation_plans = {}
+    # functions called with model when first cache class gets registered
+    # in model_caches for it
+    model_registered_callbacks = []
 
     def __init__(self, *args, **kwargs):
         """ self is the class with BaseModelQueryCacheMeta as its
@@ -516,10 +1398,25 @@ class BaseModelQueryCacheMeta(ABCMeta):
         if is_abstract_class(self):
             return
 
+        if self.overrides_get_key():
+            # get_key may still be called through super(), key builder of
+            # the class is compiled then
+            self.key_builder = None
+        else:
+            self.key_builder = staticmethod(self.compile_key_builder())
+
         # register self in model_caches dict corressponding to all the models
         # against which cache should get invalidated.
         for model in self.get_invalidation_models():
+            if not self.model_caches.get(model):
+                for callback in self.model_registered_callbacks:
+                    callback(model)
             self.model_caches[model].append(self)
+            self.invalidation_plans[model] = tuple(
+                cache_class.get_invalidation_step(model)
+                for cache_class in self.model_caches[model])
+            attnames = get_invalidation_attnames(model)
+            track_fields(model, attnames)
 
         target_models = self.get_cache_model()
         if target_models:
@@ -536,6 +1433,12 @@ class BaseModelQueryCache(six.with_metaclass(BaseModelQueryCacheMeta, Cache)):
     """
     generic_fields_support = True
 
+    # Names of fields (with relation path for fields of related models,
+    # E.g. 'b__text') on which cached values depend, besides key fields.
+    # Caches are not invalidated when saving an instance changes none of
+    # them. None means values depend on all fields.
+    depends_on_fields = None
+
     def __init__(self, *args, **kwargs):
         if USING_KWARG in kwargs:
             self.using = kwargs.pop(USING_KWARG)
@@ -566,6 +1469,10 @@ class BaseModelQueryCache(six.with_metaclass(BaseModelQueryCacheMeta, Cache)):
             self.using = kwargs.pop(USING_KWARG)
         return super(BaseModelQueryCache, self).get(*args, **kwargs)
 
+    @instancemethod
+    def aget(self, *args, **kwargs):
+        return super(BaseModelQueryCache, self).aget(*args, **kwargs)
+
     @instancemethod
     def set(self, *args, **kwargs):
         return super(BaseModelQueryCache, self).set(*args, **kwargs)
@@ -607,54 +1514,271 @@ class BaseModelQueryCache(six.with_metaclass(BaseModelQueryCacheMeta, Cache)):
                         raise KeyFieldNotPassed(field_name)
         return field_dict
 
-    @instancemethod
-    def get_key(self, *args, **kwargs):
-        cls_name = self.__class__.__name__
-        using = kwargs.pop(USING_KWARG, self.using)
-        key = '%s__%s__%s' % (self.cache_type, using, cls_name)
-        field_dict = self.get_field_dict(*args, **kwargs)
+    def get_single_key_field(self):
+        """ Returns the field object if there is single key field which is not
+        a generic foreignkey else None.
+        """
+        if len(self.key_fields) != 1:
+            return None
+        field_name = self.key_fields[0]
+        GenericForeignKey = importGenericForeignKey()
+        if isinstance(getattr(self.model, field_name, None),
+                      GenericForeignKey):
+            return None
+        return self.model._meta.get_field(field_name)
 
-        for field_name in self.key_fields:
-            if self.generic_fields_support:
-                if hasattr(self.model, field_name):
-                    field_obj = getattr(self.model, field_name)
-                    GenericForeignKey = importGenericForeignKey()
-                    if isinstance(field_obj, GenericForeignKey):
-                        value = field_dict[field_name]
-                        if isinstance(value, tuple):
-                            ctype_id, object_id = value
-                        else:
-                            from django.contrib.contenttypes.models import ContentType
-                            ctype_id = ContentType.objects_cache.get_for_model(
-                                    value).id
-                            object_id = getattr(value, value._meta.pk.attname)
-                        key += '__%s-%s' % (ctype_id, object_id)
-                        continue
+    def get_exact_key_field(self):
+        """ Returns the single key field if database matches its values
+        exactly (integer or relation fields) else None.
+        """
+        field = self.get_single_key_field()
+        if field is None:
+            return None
+        if not (field.rel or isinstance(field, (
+                models.IntegerField, models.AutoField))):
+            return None
+        return field
 
-            field = self.model._meta.get_field(field_name)
+    @classmethod
+    def get_invalidation_step(cls, model):
+        """ Returns InvalidationStep of the class for changes in instances
+        of given model.
+        """
+        is_dynamic = cls.invalidation in [
+            InvalidationType.DYNAMIC, InvalidationType.REVALIDATE]
+        needs_db_lookup = model in getattr(cls, 'rel_models', {})
+        key_attnames = None
+        if (model is cls.model and
+                not cls.overrides_get_key() and
+                cls.uses_default_invalidation() and
+                six.get_unbound_function(cls.get_field_dict) ==
+                six.get_unbound_function(BaseModelQueryCache.get_field_dict)):
+            attnames = cls.get_key_fields_attnames()
+            # generic foreignkey takes two attnames
+            if len(attnames) == len(cls.key_fields):
+                key_attnames = tuple(attnames)
+        return InvalidationStep(cls, is_dynamic, key_attnames, needs_db_lookup,
+                                cls.get_depends_on_attnames(model))
 
-            if field_name in field_dict:
-                value = field_dict[field_name]
+    @classmethod
+    def get_depends_on_fields(cls):
+        return cls.depends_on_fields
+
+    @classmethod
+    def get_depends_on_attnames(cls, model):
+        """ Returns frozenset of attnames of given model whose change can
+        change values of the class, or None if change in any field can.
+        """
+        depends_on_fields = cls.get_depends_on_fields()
+        if depends_on_fields is None:
+            return None
+        rel_models = getattr(cls, 'rel_models', {})
+        if model is cls.model:
+            relation_path = ''
+        elif model in rel_models:
+            relation_path = rel_models[model]
+        else:
+            return None
+
+        attnames = set()
+        prefix = relation_path + '__' if relation_path else ''
+        for field_path in depends_on_fields:
+            if not field_path.startswith(prefix):
+                continue
+            field_name = field_path[len(prefix):]
+            if '__' not in field_name:
+                attnames.add(model._meta.get_field(field_name).attname)
+        if model is cls.model:
+            attnames.update(cls.get_key_fields_attnames())
+
+        relation = getattr(cls, 'relation', None)
+        if relation:
+            # change in field leading to next model of relation changes
+            # the related value
+            relation_fields = relation.split('__')
+            depth = len(relation_path.split('__')) if relation_path else 0
+            if depth < len(relation_fields):
+                attnames.add(model._meta.get_field(
+                    relation_fields[depth]).attname)
+        return frozenset(attnames)
+
+    @classmethod
+    def uses_default_invalidation(cls):
+        """ Returns whether keys to be invalidated are found from key field
+        values of changed instance as SameModelInvalidationCache does.
+        """
+        if not issubclass(cls, SameModelInvalidationCache):
+            return False
+        return cls.has_default_methods([
+                (cls.get_keys_to_be_invalidated, [
+                    InstanceCache.get_keys_to_be_invalidated,
+                    QuerysetCache.get_keys_to_be_invalidated]),
+                (cls._get_keys_to_be_invalidated, [
+                    SameModelInvalidationCache._get_keys_to_be_invalidated]),
+                (cls.get_invalidation_params_list_, [
+                    SameModelInvalidationCache.get_invalidation_params_list_])])
+
+    @classmethod
+    def uses_default_related_invalidation(cls):
+        """ Returns whether keys to be invalidated are found from key field
+        values of changed instance, or by querying the model for changed
+        related instance, as RelatedModelInvalidationCache does.
+        """
+        mixin = RelatedModelInvalidationCache
+        if not issubclass(cls, mixin):
+            return False
+        # related caches call _get_keys_to_be_invalidated of the mixin
+        # directly, so only these two methods can be overridden
+        return cls.has_default_methods([
+                (cls.get_keys_to_be_invalidated, [
+                    RelatedInstanceCache.get_keys_to_be_invalidated,
+                    RelatedQuerysetCache.get_keys_to_be_invalidated]),
+                (cls.get_invalidation_params_list, [
+                    mixin.get_invalidation_params_list])])
+
+    @classmethod
+    def has_default_methods(cls, method_defaults):
+        """ Returns whether each method in given list of (method,
+        default_methods) pairs is one of its default methods, i.e. it's not
+        overridden in the class.
+        """
+        for method, default_methods in method_defaults:
+            if six.get_unbound_function(method) not in [
+                    six.get_unbound_function(default_method)
+                    for default_method in default_methods]:
+                return False
+        return True
+
+    @classmethod
+    def get_key_fields_attnames(cls):
+        """ Returns attnames of model fields whose values make the key.
+        For generic foreignkey both content type and object id attnames
+        are returned.
+        """
+        attnames = []
+        GenericForeignKey = importGenericForeignKey()
+        for field_name in cls.key_fields:
+            field_obj = getattr(cls.model, field_name, None)
+            if isinstance(field_obj, GenericForeignKey):
+                attnames.append(cls.model._meta.get_field(
+                    field_obj.ct_field).attname)
+                attnames.append(field_obj.fk_field)
+            else:
+                attnames.append(cls.model._meta.get_field(field_name).attname)
+        return attnames
+
+    def get_key_field_values(self, field, params_list):
+        """ Returns the list of values of given single key field in given
+        list of (args, kwargs) pairs, as they are in the database.
+        """
+        field_values = []
+        for args, kwargs in params_list:
+            field_dict = self.get_field_dict(*args, **kwargs)
+            if field.name in field_dict:
+                value = field_dict[field.name]
             else:
                 value = field_dict[field.attname]
             if isinstance(value, models.Model):
-                # get the pk value on instance
-                if field.rel:
-                    rel_model = field.rel.to
+                value = getattr(value, value._meta.pk.attname)
+            field_values.append(field.to_python(value))
+        return field_values
+
+    @classmethod
+    def overrides_get_key(cls):
+        """ Returns whether the class or one of its bases below
+        BaseModelQueryCache has its own get_key.
+        """
+        get_key_owner = next(
+            klass for klass in cls.__mro__ if 'get_key' in vars(klass))
+        return get_key_owner is not BaseModelQueryCache
+
+    @classmethod
+    def compile_key_builder(cls):
+        """ Returns function building key of the class for given using, args
+        and kwargs.
+
+        Key fields are looked up and key format is made here once, so that
+        building a key is just picking the values and formatting them.
+        """
+        GenericForeignKey = importGenericForeignKey()
+        key_getters = []
+        for field_name in cls.key_fields:
+            field_obj = getattr(cls.model, field_name, None)
+            if (cls.generic_fields_support and
+                    isinstance(field_obj, GenericForeignKey)):
+                key_getters.append(
+                    (field_name, None, get_generic_key_value))
+            else:
+                field = cls.model._meta.get_field(field_name)
+                key_getters.append(
+                    (field_name, field.attname, get_field_key_value))
+
+        key_format = '%s__%%s__%s%s__v%s' % (
+            cls.cache_type, cls.__name__,
+            '__%s' * len(key_getters), str(cls.version).replace('%', '%%'))
+        use_generation = cls.use_generation
+        if use_generation:
+            key_format += '__g%s'
+        # overriden get_field_dict has to be used to get values of fields
+        use_field_dict = (
+            six.get_unbound_function(cls.get_field_dict) !=
+            six.get_unbound_function(BaseModelQueryCache.get_field_dict))
+        num_fields = len(key_getters)
+
+        def build_key(cache, using, args, kwargs):
+            if use_field_dict:
+                kwargs = cache.get_field_dict(*args, **kwargs)
+                args = ()
+            num_args = len(args)
+            if num_args > num_fields:
+                raise IndexError('More args than key fields are passed')
+            values = [using]
+            for i, (field_name, attname, get_key_value) in enumerate(
+                    key_getters):
+                if i < num_args:
+                    value = args[i]
+                elif field_name in kwargs:
+                    value = kwargs[field_name]
+                elif attname is not None and attname in kwargs:
+                    value = kwargs[attname]
                 else:
-                    # In very rare cases, field.rel is found to be None
-                    # that I do not know why.
-                    # fallback method to get rel_model
-                    rel_model = value.__class__
-                value = getattr(value, rel_model._meta.pk.attname)
-            """
-            if isinstance(value, unicode):
-                value = value.encode('utf-8')
-            """
-            key += '__%s' % str(value)
-        key += '__v%s' % self.version
-        key = memcache_key_escape(key)
-        return key
+                    raise KeyFieldNotPassed(field_name)
+                values.append(get_key_value(value))
+            if use_generation:
+                values.append(cls.get_generation())
+            return memcache_key_escape(key_format % tuple(values))
+        return build_key
+
+    @instancemethod
+    def get_key(self, *args, **kwargs):
+        using = kwargs.pop(USING_KWARG, self.using)
+        key_builder = self.key_builder
+        if key_builder is None:
+            cls = type(self)
+            key_builder = cls.compile_key_builder()
+            cls.key_builder = staticmethod(key_builder)
+        return key_builder(self, using, args, kwargs)
+
+
+def get_field_key_value(value):
+    """ Returns value of a key field to be put in key
+    """
+    if isinstance(value, models.Model):
+        # get the pk value on instance
+        value = getattr(value, value._meta.pk.attname)
+    return value
+
+
+def get_generic_key_value(value):
+    """ Returns value of a generic foreignkey key field to be put in key
+    """
+    if isinstance(value, tuple):
+        ctype_id, object_id = value
+    else:
+        from django.contrib.contenttypes.models import ContentType
+        ctype_id = ContentType.objects_cache.get_for_model(value).id
+        object_id = getattr(value, value._meta.pk.attname)
+    return '%s-%s' % (ctype_id, object_id)
 
 
 class InstanceCacheMeta(BaseModelQueryCacheMeta):
@@ -810,6 +1934,7 @@ class InstanceCache(six.with_metaclass(InstanceCacheMeta,
                 'relation': relation,
                 'version': cls.version,
                 'timeout': cls.timeout,
+                'use_generation': cls.use_generation,
             })
             # And store it's instance in related_caches
             cls.related_caches[relation] = related_cache_class
@@ -879,11 +2004,111 @@ class InstanceCache(six.with_metaclass(InstanceCacheMeta,
         instance = self.get_instance(**params)
         return instance
 
+    def get_values_for_params_list(self, params_list):
+        """ Returns the list of values for given list of (args, kwargs) pairs.
+        Raises the exception of first params whose value couldn't be got.
+        """
+        values = []
+        for is_exception, value in self._get_results_for_params_list(
+                params_list):
+            if is_exception:
+                raise value
+            values.append(value)
+        return values
+
+    def get_results_for_params_list(self, params_list):
+        if (six.get_unbound_function(type(self).get_values_for_params_list) !=
+                six.get_unbound_function(
+                    InstanceCache.get_values_for_params_list)):
+            # values are got the way derived class gets them
+            return super(InstanceCache, self).get_results_for_params_list(
+                    params_list)
+        return self._get_results_for_params_list(params_list)
+
+    def _get_results_for_params_list(self, params_list):
+        """ Returns the list of (is_exception, value or exception) pairs for
+        given list of (args, kwargs) pairs.
+
+        If class is simple and has single key field then all instances are
+        got in a single `__in` query. Instances not found in it don't exist
+        if the key field is matched exactly by database (integer or relation
+        field), else they are got one by one.
+        """
+        field = None
+        if self.is_simple:
+            field = self.get_single_key_field()
+
+        if field is None or len(params_list) < 2:
+            return [self.get_result_for_params(args, kwargs)
+                    for args, kwargs in params_list]
+
+        field_values = self.get_key_field_values(field, params_list)
+        queryset = self.get_queryset().filter(**{
+            '%s__in' % field.attname: set(field_values)})
+        if hasattr(self, 'select_related'):
+            queryset = queryset.select_related(*self.select_related)
+        instances_dict = defaultdict(list)
+        for instance in queryset:
+            instances_dict[getattr(instance, field.attname)].append(instance)
+        is_exact = self.get_exact_key_field() is not None
+
+        results = []
+        for field_value, (args, kwargs) in zip(field_values, params_list):
+            instances = instances_dict.get(field_value, [])
+            if len(instances) == 1:
+                results.append((False, instances[0]))
+            elif not instances and is_exact:
+                # as get_instance of simple class returns when not found
+                results.append((False, None))
+            else:
+                # Not found or multiple found, let get_instance decide.
+                # (Value may also be matched differently by database, e.g.
+                # case insensitively)
+                results.append(self.get_result_for_params(args, kwargs))
+        return results
+
+    @instancemethod
+    def get_many(self, values, **kwargs):
+        """ Returns dict of given values and instances found for them.
+        Values for which instance is not found are left out.
+
+        Each value is the param of key field, or tuple of params if class has
+        more than one key field.
+        """
+        if USING_KWARG in kwargs:
+            self.using = kwargs.pop(USING_KWARG)
+
+        batch_query = BatchCacheQuery()
+        for value in values:
+            if len(self.key_fields) == 1:
+                args = (value,)
+            else:
+                args = tuple(value)
+            batch_query.push({
+                value: type(self)(*args, **{USING_KWARG: self.using}),
+            })
+
+        value_dict = {}
+        for value, result in batch_query.get(return_exceptions=True).items():
+            if isinstance(result, ObjectDoesNotExist):
+                continue
+            if isinstance(result, Exception):
+                raise result
+            value_dict[value] = result
+        return value_dict
+
     def pre_set_process_value(self, instance, *args, **kwargs):
         instance_clone = copy.copy(instance)
         self.remove_fk_instances(instance_clone)
         return instance_clone
 
+    def get_reset_value(self, instance):
+        """ Returns the value to be set in cache for given saved instance,
+        used by RESET invalidation.
+        """
+        value = self.to_cache_value(self.pre_set_process_value(instance))
+        return WrappedValue(value, self.get_dynamic_version(), time.time())
+
     def get_extra_key_value_dict(self, instance, *args, **kwargs):
         """ Returns the key value dict from relations given in select_related
         for given instance. Used when instance is saved in cache.
@@ -975,7 +2200,7 @@ class RelatedModelInvalidationCache(object):
     """ Mixin class used in RelatedInstanceCache, RelatedQuerysetCache
     """
     def _get_invalidation_models(self):
-        return [self.model] + self.rel_models.keys()
+        return [self.model] + list(self.rel_models.keys())
 
     def _get_keys_to_be_invalidated(self, instance, signal, using):
         keys = []
@@ -1156,6 +2381,29 @@ class QuerysetCache(six.with_metaclass(QuerysetCacheMeta,
         result = self.get_result(**params)
         return result
 
+    def get_values_for_params_list(self, params_list):
+        """ Returns the list of values for given list of (args, kwargs) pairs.
+
+        If class is simple and has single integer or relation key field
+        then results for all are got in a single `__in` query.
+        """
+        field = None
+        if self.is_simple:
+            field = self.get_exact_key_field()
+
+        if field is None or len(params_list) < 2:
+            return super(QuerysetCache, self).get_values_for_params_list(
+                    params_list)
+
+        field_values = self.get_key_field_values(field, params_list)
+        queryset = self.get_queryset().filter(**{
+            '%s__in' % field.attname: set(field_values)})
+        results_dict = defaultdict(list)
+        for instance in queryset:
+            results_dict[getattr(instance, field.attname)].append(instance)
+        return [list(results_dict.get(field_value, []))
+                for field_value in field_values]
+
 
 class RelatedQuerysetCacheMeta(QuerysetCacheMeta):
     """ Meta class of RelatedQuerysetCache class
@@ -1235,6 +2483,41 @@ class QuerysetExistsCache(QuerysetCache):
     def get_result(self, **params):
         return self.get_queryset().filter(**params).exists()
 
+    @classmethod
+    def get_depends_on_fields(cls):
+        """ Existance depends only on key fields if neither get_result nor
+        get_queryset is overriden. It assumes `objects` manager of the model
+        doesn't filter on other fields.
+        """
+        if (cls.depends_on_fields is None and
+                six.get_unbound_function(cls.get_result) ==
+                six.get_unbound_function(QuerysetExistsCache.get_result) and
+                six.get_unbound_function(cls.get_queryset) ==
+                six.get_unbound_function(BaseModelQueryCache.get_queryset)):
+            return ()
+        return cls.depends_on_fields
+
+    def get_values_for_params_list(self, params_list):
+        """ If get_result is not overriden and there is single integer or
+        relation key field then existance for all params is got in a single
+        query.
+        """
+        field = None
+        if (six.get_unbound_function(type(self).get_result) ==
+                six.get_unbound_function(QuerysetExistsCache.get_result)):
+            field = self.get_exact_key_field()
+
+        if field is None or len(params_list) < 2:
+            return [self.get_value_for_params(*args, **kwargs)
+                    for args, kwargs in params_list]
+
+        field_values = self.get_key_field_values(field, params_list)
+        existing_values = set(self.get_queryset().filter(**{
+            '%s__in' % field.attname: set(field_values)}).values_list(
+                field.attname, flat=True).distinct())
+        return [field_value in existing_values
+                for field_value in field_values]
+
     def post_process_value(self, value, *args, **kwargs):
         """ It's defined cause cache retuned values are integers (0 or 1)
             It converts them to boolean
@@ -1422,6 +2705,8 @@ class ModelCacheManager(six.with_metaclass(ModelCacheManagerMeta,
                         CacheManager)):
     version = 0
     timeout = flash_settings.DEFAULT_TIMEOUT
+    process_cache_timeout = None
+    serializer = get_default_serializer()
 
     @abstractproperty
     def model(self):
@@ -1440,6 +2725,8 @@ class ModelCacheManager(six.with_metaclass(ModelCacheManagerMeta,
                 'key_fields': key_fields,
                 'version': self.version,
                 'timeout': self.timeout,
+                'process_cache_timeout': self.process_cache_timeout,
+                'serializer': self.serializer,
             })
 
     def register_queryset_classes(self):
@@ -1455,6 +2742,7 @@ class ModelCacheManager(six.with_metaclass(ModelCacheManagerMeta,
                 'key_fields': key_fields,
                 'version': self.version,
                 'timeout': self.timeout,
+                'serializer': self.serializer,
             })
 
     def get_key_fields(self, args_or_kwargs):
@@ -1506,6 +2794,23 @@ class ModelCacheManager(six.with_metaclass(ModelCacheManagerMeta,
             return instance_cache_class.get(**kwargs)
         raise CacheNotRegistered(self.model, key_fields)
 
+    def get_many(self, **kwargs):
+        """ Find the instance_cache_class for given field and return dict of
+        given values and instances found for them.
+
+        E.g. Model.cache.get_many(id=[1, 2, 3])
+        """
+        using_kwargs = {}
+        if USING_KWARG in kwargs:
+            using_kwargs[USING_KWARG] = kwargs.pop(USING_KWARG)
+        assert len(kwargs) == 1, "get_many takes values of exactly one field"
+        key_fields = self.get_key_fields(kwargs)
+        values = list(kwargs.values())[0]
+        if key_fields in self.simple_instance_cache_classes:
+            instance_cache_class = self.simple_instance_cache_classes[key_fields]
+            return instance_cache_class.get_many(values, **using_kwargs)
+        raise CacheNotRegistered(self.model, key_fields)
+
     def get_query(self, **kwargs):
         """ Find the instance_cache_class for given params
         and return it's object for given params.
@@ -1519,14 +2824,14 @@ class ModelCacheManager(six.with_metaclass(ModelCacheManagerMeta,
     def get_async(self, **kwargs):
         """ await counterpart of get method
         """
-        return self.get_query(**kwargs).resolve_async()
+        return self.get_query(**kwargs).aresolve()
 
     def get_async_or_none(self, **kwargs):
-        from .loader import object_or_none
+        from .aio import object_or_none
         return object_or_none(self.get_async(**kwargs))
 
     def get_async_or_404(self, **kwargs):
-        from .loader import object_or_404
+        from .aio import object_or_404
         return object_or_404(self.get_async(**kwargs))
 
     def get_cache_class_for(self, *args):
@@ -1572,7 +2877,7 @@ class ModelCacheManager(six.with_metaclass(ModelCacheManagerMeta,
     def filter_async(self, **kwargs):
         """ await counterpart of filter method.
         """
-        return self.filter_query(**kwargs).resolve_async()
+        return self.filter_query(**kwargs).aresolve()
 
     def filter_cache_class_for(self, *args):
         """ Find the queryset_cache_class for given params
@@ -1,4 +1,6 @@
 import six
+import heapq
+import itertools
 
 from collections import defaultdict
 from functools import wraps
@@ -9,15 +11,6 @@ from .lazy_utils import Lazy, LazyCall, eval_object
 ltype = (list, tuple)
 Identity = object()
 
-def smallest_path(iterable):
-    min_cost = None
-    min_path = None
-    for path, cost in iterable:
-        if min_path is None or min_path > cost:
-            min_path = path
-            min_cost = cost
-    return min_path, min_cost
-
 class LazyCollectorMeta(type):
     def __init__(self, *args, **kwargs):
         super(LazyCollectorMeta, self).__init__(*args, **kwargs)
@@ -42,21 +35,21 @@ class LazyCollectorMeta(type):
     def check_collectables(self):
         assert hasattr(self, 'collectables')
         for node in self.collectables:
-            assert isinstance(node, basestring)
+            assert isinstance(node, six.string_types)
 
     def check_collector(self):
         assert hasattr(self, 'collector')
         assert isinstance(self.collector, dict)
         for key, value in self.collector.items():
-            assert isinstance(key, basestring)
+            assert isinstance(key, six.string_types)
             assert isinstance(value, ltype)
             for v in value:
-                assert isinstance(v, basestring)
+                assert isinstance(v, six.string_types)
                 assert v in self.collectables
 
     def store_connections(self):
         self.connections = defaultdict(list)
-        for value in self.__dict__.itervalues():
+        for value in list(self.__dict__.values()):
             if hasattr(value, 'connect_params'):
                 self.register_connect(value)
 
@@ -67,42 +60,71 @@ class LazyCollectorMeta(type):
         self.connections[to_node].append(connect_params)
 
     def insure_collectables_achievable(self):
+        """ Stores the cheapest path to each collectable from each params in
+        paths, solving the graph once for each params.
+        """
         self.paths = {}
-        for end_node in self.collectables:
-            for params in self.params_list:
-                path, _cost = smallest_path(self.get_path(end_node, params))
-                assert path is not None, (
-                        "No path exists from %s to %s" % (params, end_node))
-                self.paths[(end_node, params)] = path
-
-    def get_path(self, end_node, params, node_visited=None):
+        unreachable = []
+        for params in self.params_list:
+            solved = self.solve_paths(params)
+            for end_node in self.collectables:
+                if end_node in solved:
+                    self.paths[(end_node, params)] = solved[end_node][0]
+                else:
+                    unreachable.append((end_node, params))
+        assert not unreachable, "No path exists in %s to %s" % (
+                self.__name__, ', '.join('%s from %s' % (end_node, params)
+                                         for end_node, params in unreachable))
+
+    def solve_paths(self, params):
+        """ Returns dict of all nodes reachable from params and (path, cost)
+        pair of the cheapest path to them. Cost of a path is the number of
+        connections with cache hit in it.
+
+        A path is Identity for params, or (connection, paths of its from
+        nodes). Nodes are solved in order of their cost, and a connection is
+        tried once all its from nodes are solved. So each connection is
+        looked at once.
+        """
+        solved = {}
+        # connections waiting for their from nodes to get solved
+        waiting = {}
+        dependents = defaultdict(list)
+        # (cost, order, node, path), order keeps the first found path among
+        # paths of same cost
+        heap = []
+        order = itertools.count()
         for param in params:
-            if param == end_node:
-                yield Identity, 0
-
-        if node_visited is None:
-            node_visited = set()
-        else:
-            node_visited = set(node_visited)
-        node_visited.add(end_node)
-
-        for connection in self.connections[end_node]:
-            paths_list = []
-            exists = True
-            cost_sum = int(connection['cache_hit'] == True)
-            for from_node in connection['from_nodes']:
-                if from_node in node_visited:
-                    exists = False
-                    break
-                path, cost = smallest_path(self.get_path(from_node, params,
-                        node_visited=node_visited))
-                if path is None:
-                    exists = False
-                    break
-                paths_list.append(path)
-                cost_sum += cost
-            if exists:
-                yield (connection, paths_list), cost_sum
+            heapq.heappush(heap, (0, next(order), param, Identity))
+        for connections in self.connections.values():
+            for connection in connections:
+                from_nodes = set(connection['from_nodes'])
+                waiting[id(connection)] = len(from_nodes)
+                for from_node in from_nodes:
+                    dependents[from_node].append(connection)
+                if not from_nodes:
+                    heapq.heappush(heap, (
+                        int(connection['cache_hit'] == True), next(order),
+                        connection['to_node'], (connection, [])))
+
+        while heap:
+            cost, _, node, path = heapq.heappop(heap)
+            if node in solved:
+                continue
+            solved[node] = (path, cost)
+            for connection in dependents[node]:
+                waiting[id(connection)] -= 1
+                if waiting[id(connection)] or connection['to_node'] in solved:
+                    continue
+                from_nodes = connection['from_nodes']
+                cost_sum = int(connection['cache_hit'] == True) + sum(
+                    solved[from_node][1] for from_node in from_nodes)
+                paths_list = [solved[from_node][0]
+                              for from_node in from_nodes]
+                heapq.heappush(heap, (cost_sum, next(order),
+                                      connection['to_node'],
+                                      (connection, paths_list)))
+        return solved
 
     def get(self, collector_name, **kwargs):
         return eval_object(self.get_lazy(collector_name, **kwargs))
@@ -116,7 +138,7 @@ class LazyCollectorMeta(type):
         return Lazy(d)
 
     def get_node(self, end_node, params, kwargs):
-        if isinstance(end_node, basestring):
+        if isinstance(end_node, six.string_types):
             path = self.paths[(end_node, params)]
         else:
             path = end_node
@@ -147,8 +169,8 @@ def connect(from_nodes, to_node, cache_hit=False):
     from_nodes_orig = from_nodes
     from_nodes = tuple(sorted(from_nodes))
     for val in from_nodes:
-        assert isinstance(val, basestring)
-    assert isinstance(to_node, basestring)
+        assert isinstance(val, six.string_types)
+    assert isinstance(to_node, six.string_types)
 
     def decorator(method):
         method.connect_params = {
@@ -2,7 +2,7 @@ from django.contrib.contenttypes.models import (
         ContentType, ContentTypeManager)
 
 from flash.base import InstanceCache
-from flash.constants import CACHE_TIME_MONTH
+from flash.constants import CACHE_TIME_MONTH, CACHE_TIME_M
 
 
 class ContentTypeCacheManager(ContentTypeManager):
@@ -44,3 +44,4 @@ class ContentTypeCacheOnAppModel(InstanceCache):
     model = ContentType
     key_fields = ('app_label', 'model')
     timeout = CACHE_TIME_MONTH
+    process_cache_timeout = CACHE_TIME_M
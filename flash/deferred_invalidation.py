@@ -0,0 +1,111 @@
+""" Invalidation of caches made inside transaction.atomic blocks.
+
+Keys invalidated while a transaction is open are collected per db alias and
+invalidated together once the transaction commits, so that other processes
+don't cache values which are not committed yet. Till then, reads of these
+keys in the same thread treat them as just invalidated. If the transaction
+is rolled back the collected keys are dropped.
+"""
+import threading
+
+from django.db import transaction
+
+from flash import settings as flash_settings
+
+
+_local = threading.local()
+
+
+class PendingInvalidation(object):
+    """ Keys to be invalidated when transaction of db `using` commits.
+    """
+    def __init__(self, using, invalidate):
+        self.using = using
+        self.invalidate = invalidate
+        self.unset_cache_keys = set()
+        self.dynamic_cache_keys = set()
+        # dict of key and (value, timeout) to be set
+        self.reset_values = {}
+
+    def add(self, unset_cache_keys, dynamic_cache_keys, reset_values):
+        # later invalidation of a key overrides earlier one
+        for key in unset_cache_keys:
+            self.reset_values.pop(key, None)
+        self.unset_cache_keys.update(unset_cache_keys)
+        self.dynamic_cache_keys.update(dynamic_cache_keys)
+        for timeout, key_value_dict in reset_values.items():
+            for key, value in key_value_dict.items():
+                self.unset_cache_keys.discard(key)
+                self.reset_values[key] = (value, timeout)
+
+    def __contains__(self, key):
+        return (key in self.unset_cache_keys or
+                key in self.dynamic_cache_keys or
+                key in self.reset_values)
+
+    def is_registered(self):
+        """ Returns whether flush is still to be run on commit, it's not if
+        transaction has been rolled back.
+        """
+        connection = transaction.get_connection(self.using)
+        return any(entry[1] == self.flush
+                   for entry in connection.run_on_commit)
+
+    def flush(self):
+        pending_invalidations = getattr(_local, 'pending_invalidations', {})
+        if pending_invalidations.get(self.using) is self:
+            del pending_invalidations[self.using]
+        reset_values = {}
+        for key, (value, timeout) in self.reset_values.items():
+            reset_values.setdefault(timeout, {})[key] = value
+        self.invalidate(list(self.unset_cache_keys),
+                        list(self.dynamic_cache_keys), reset_values)
+
+
+def get_pending_invalidations():
+    """ Returns dict of db alias and its PendingInvalidation in current
+    thread.
+    """
+    pending_invalidations = getattr(_local, 'pending_invalidations', None)
+    if pending_invalidations is None:
+        pending_invalidations = _local.pending_invalidations = {}
+    for using, pending in list(pending_invalidations.items()):
+        if not pending.is_registered():
+            del pending_invalidations[using]
+    return pending_invalidations
+
+
+def defer_invalidation(unset_cache_keys, dynamic_cache_keys, reset_values,
+                       using, invalidate):
+    """ Collects keys to be invalidated by calling invalidate with them when
+    transaction of db `using` commits.
+
+    Returns False if there is no transaction (autocommit) and keys have to
+    be invalidated right away.
+    """
+    if not hasattr(transaction, 'on_commit'):
+        # Django < 1.9
+        return False
+    if not flash_settings.DEFER_INVALIDATION:
+        return False
+    if not transaction.get_connection(using).in_atomic_block:
+        return False
+    pending_invalidations = get_pending_invalidations()
+    pending = pending_invalidations.get(using)
+    if pending is None:
+        pending = PendingInvalidation(using, invalidate)
+        pending_invalidations[using] = pending
+        transaction.on_commit(pending.flush, using)
+    pending.add(unset_cache_keys, dynamic_cache_keys, reset_values)
+    return True
+
+
+def get_pending_keys(keys):
+    """ Returns those of given keys which are to be invalidated on commit
+    of transactions open in current thread.
+    """
+    if not getattr(_local, 'pending_invalidations', None):
+        return []
+    pending_invalidations = get_pending_invalidations().values()
+    return [key for key in keys
+            if any(key in pending for pending in pending_invalidations)]
@@ -0,0 +1,48 @@
+""" Bounded pool of threads getting values from fallback methods (E.g. db),
+so that callers like the asyncio event loop are not blocked meanwhile, or
+values of many queries are got concurrently.
+"""
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+
+from flash import settings as flash_settings
+
+
+class FallbackPool(object):
+    """ Runs submitted functions in at most max_workers threads and returns
+        futures of their results.
+    """
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self.executor = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def get_executor(self):
+        if self.executor is None:
+            with self.lock:
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(self.max_workers)
+        return self.executor
+
+    def submit(self, func, *args):
+        return self.get_executor().submit(self.run, func, args)
+
+    def in_worker(self):
+        """ Returns whether current thread is a thread of the pool
+        """
+        return getattr(self.local, 'is_worker', False)
+
+    def run(self, func, args):
+        self.local.is_worker = True
+        close_old_connections()
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+
+
+fallback_pool = FallbackPool(flash_settings.FALLBACK_POOL_SIZE)
@@ -1,5 +1,4 @@
 from django.conf import settings
-from django.dispatch import receiver
 from django.db.models.signals import post_init, pre_save, post_save
 from django.db import models
 
@@ -15,26 +14,35 @@ class AttrDict(dict):
 
 
 class ModelStateDiff(object):
-    """ To contain the state of values of all fields in instance.
+    """ To contain the state of values of tracked fields in instance.
         And contain the diff of fields if save() is called.
+
+        It isn't pickled along with instance, state is saved again when
+        instance is unpickled.
     """
-    def __init__(self):
-        self.state = {}
-        self.diff = AttrDict()
+    __slots__ = ('attnames', 'values', 'diff')
+
+    def __init__(self, attnames=(), values=()):
+        self.attnames = attnames
+        self.values = values
+        self.diff = None
+
+    @property
+    def state(self):
+        return dict((attname, value) for attname, value in zip(
+            self.attnames, self.values) if value is not _missing)
+
+    def __reduce__(self):
+        return (ModelStateDiff, ())
 
     def __setstate__(self, state):
-        """ Override this method to set custom pickle.loads on it.
+        """ Instances pickled by older versions have state and diff of
+        all fields which is dropped.
         """
-        if 'diff' in state:
-            diff = state['diff']
-            if not isinstance(diff, AttrDict):
-                diff = AttrDict(diff)
-                state['diff'] = diff
-                for attr, val in diff.items():
-                    if not isinstance(val, Diff):
-                        diff[attr] = Diff(**val)
-        self.state = state['state']
-        self.diff = state['diff']
+        self.__init__()
+
+
+_missing = object()
 
 
 class Diff(dict):
@@ -71,52 +79,95 @@ class Diff(dict):
         return u'Diff' + super(Diff, self).__repr__()
 
 
+# attnames of fields whose state is kept for models. State of all fields
+# except file fields is kept for models not in it.
+tracked_attnames = {}
+
+_simple_attnames = {}
+
+
 def get_simple_fields(instance):
     return filter(lambda field: not isinstance(field, models.FileField),
                     instance._meta.local_fields)
 
 
+def track_fields(model, attnames):
+    """ Keep state of only given attnames of model, or of all fields if
+    attnames is None.
+    """
+    if attnames is None:
+        tracked_attnames.pop(model, None)
+    else:
+        tracked_attnames[model] = tuple(attnames)
+
+
+def get_tracked_attnames(instance):
+    model = instance.__class__
+    attnames = tracked_attnames.get(model)
+    if attnames is None:
+        attnames = _simple_attnames.get(model)
+        if attnames is None:
+            attnames = tuple(field.attname
+                             for field in get_simple_fields(instance))
+            _simple_attnames[model] = attnames
+    return attnames
+
+
 def save_state(instance):
-    for field in get_simple_fields(instance):
-        if field.attname in instance.__dict__:
-            instance._statediff.state[field.attname] = instance.__dict__[
-                    field.attname]
+    attnames = get_tracked_attnames(instance)
+    instance_dict = instance.__dict__
+    values = tuple(instance_dict.get(attname, _missing)
+                   for attname in attnames)
+    statediff = instance_dict.get('_statediff')
+    if statediff is None:
+        instance._statediff = ModelStateDiff(attnames, values)
+    else:
+        # keep the diff as invalidation may still need it
+        statediff.attnames = attnames
+        statediff.values = values
 
 
-@receiver(post_init)
 def post_init_statediff(sender, instance, **kwargs):
     try:
-        instance._statediff = ModelStateDiff()
         save_state(instance)
     except:
         if settings.DEBUG:
             raise
 
 
-@receiver(pre_save)
 def pre_save_statediff(sender, instance, **kwargs):
     try:
-        if not hasattr(instance, '_statediff'):
-            instance._statediff = ModelStateDiff()
+        statediff = instance.__dict__.get('_statediff')
+        if statediff is None:
+            # state before changes is not known, so diff is not known
             save_state(instance)
-        instance._statediff.diff = AttrDict()
-        for field in get_simple_fields(instance):
-            if field.attname in instance.__dict__:
-                post_value = instance.__dict__[field.attname]
-                if not instance._state.adding:
-                    if field.attname in instance._statediff.state:
-                        pre_value = instance._statediff.state.get(field.attname)
-                        if not post_value == pre_value:
-                            instance._statediff.diff[field.attname] = Diff(
-                                    post_value, pre_value)
-                else:
-                    instance._statediff.diff[field.attname] = Diff(post_value)
+            return
+        diff = AttrDict()
+        instance_dict = instance.__dict__
+        adding = instance._state.adding
+        update_fields = kwargs.get('update_fields')
+        if update_fields and not adding:
+            for field in instance._meta.concrete_fields:
+                if (field.name in update_fields or
+                        field.attname in update_fields):
+                    # deferred fields being saved are loaded as save does,
+                    # and are taken as changed below
+                    getattr(instance, field.attname)
+        for attname, pre_value in zip(statediff.attnames, statediff.values):
+            if attname in instance_dict:
+                post_value = instance_dict[attname]
+                if adding or pre_value is _missing:
+                    # value before a deferred field was set isn't known,
+                    # so it's taken as changed
+                    diff[attname] = Diff(post_value)
+                elif not post_value == pre_value:
+                    diff[attname] = Diff(post_value, pre_value)
+        statediff.diff = diff
     except:
         if settings.DEBUG:
             raise
 
 
-@receiver(post_save)
 def post_save_statediff(sender, instance, created, **kwargs):
     try:
         save_state(instance)
@@ -126,8 +177,9 @@ def post_save_statediff(sender, instance, created, **kwargs):
 
 
 def get_state_diff(self):
-    if hasattr(self, '_statediff'):
-        return self._statediff.diff
+    statediff = getattr(self, '_statediff', None)
+    if statediff is not None and statediff.diff is not None:
+        return statediff.diff
     return AttrDict()
 
 
@@ -136,5 +188,29 @@ def create_state_diff(self):
         pre_save_statediff(self.__class__, self)
 
 
+_model_setstate = getattr(models.Model, '__setstate__', None)
+
+
+def model_setstate(self, state):
+    """ Saves state of instance being unpickled as ModelStateDiff isn't
+    pickled.
+    """
+    if _model_setstate is not None:
+        _model_setstate(self, state)
+    else:
+        self.__dict__.update(state)
+    if '_statediff' in self.__dict__:
+        save_state(self)
+
+
 models.Model.get_state_diff = get_state_diff
 models.Model.create_state_diff = create_state_diff
+models.Model.__setstate__ = model_setstate
+
+
+def connect_statediff_receivers(model):
+    """ Connects receivers keeping state diff of instances of given model
+    """
+    post_init.connect(post_init_statediff, sender=model)
+    pre_save.connect(pre_save_statediff, sender=model)
+    post_save.connect(post_save_statediff, sender=model)
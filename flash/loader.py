@@ -1,8 +1,6 @@
 from aiodataloader import DataLoader
 
-from django.core.exceptions import ObjectDoesNotExist
-from django.http import Http404
-
+from .aio import get_batch_query_async, object_or_none, object_or_404
 from .base import BatchCacheQuery
 
 
@@ -14,18 +12,6 @@ class FlashCacheLoader(DataLoader):
         batch_query = BatchCacheQuery()
         for i, cache_query in enumerate(cache_queries):
             batch_query.push({i: cache_query})
-        result_dict = batch_query.get(return_exceptions=True)
+        result_dict = await get_batch_query_async(
+            batch_query, return_exceptions=True)
         return [result_dict[i] for i in range(len(cache_queries))]
-
-
-async def object_or_none(future):
-    try:
-        return await future
-    except ObjectDoesNotExist:
-        return None
-
-async def object_or_404(future):
-    try:
-        return await future
-    except ObjectDoesNotExist as e:
-        raise Http404(str(e))
@@ -0,0 +1,20 @@
+try:
+    from django.utils.deprecation import MiddlewareMixin
+except ImportError:
+    MiddlewareMixin = object
+
+from flash import request_cache
+
+
+class RequestCacheMiddleware(MiddlewareMixin):
+    """ Activates flash's request cache for the time a request is processed.
+    """
+    def process_request(self, request):
+        request_cache.activate()
+
+    def process_response(self, request, response):
+        request_cache.deactivate()
+        return response
+
+    def process_exception(self, request, exception):
+        request_cache.deactivate()
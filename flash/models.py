@@ -1,8 +1,18 @@
+import time
+
 from django.db import models
 
+from flash import settings as flash_settings
+
+# key in cache changed whenever some dynamic version gets changed
+VERSIONS_EPOCH_KEY = 'flash__dynamic_versions_epoch'
+
 
 class CacheDynamicVersionManager(models.Manager):
     _local_cache = {}
+    # epoch of versions in _local_cache and time of next check of it
+    _epoch = None
+    _next_check_at = 0
 
     def get_version_of(self, cache_class):
         cache_type = cache_class.cache_type
@@ -13,6 +23,9 @@ class CacheDynamicVersionManager(models.Manager):
                 cache_class.model == CacheDynamicVersion):
             return None
 
+        if time.time() >= self._next_check_at:
+            self.refresh_local_cache()
+
         if self._local_cache == {}:
                 self.populate_local_cache()
 
@@ -41,9 +54,53 @@ class CacheDynamicVersionManager(models.Manager):
             cache_version.version += 1
             cache_version.save()
             self.add_to_local_cache(cache_version)
+            self.increment_epoch()
         except CacheDynamicVersion.DoesNotExist:
             pass
 
+    def get_epoch(self):
+        from flash.base import cache
+        epoch = cache.get(VERSIONS_EPOCH_KEY)
+        if epoch is None:
+            # epoch starts from current time so that an evicted epoch is not
+            # taken as unchanged
+            epoch = int(time.time() * 1000)
+            if not cache.add(VERSIONS_EPOCH_KEY, epoch, timeout=None):
+                epoch = cache.get(VERSIONS_EPOCH_KEY, epoch)
+        return epoch
+
+    def increment_epoch(self):
+        from flash.base import cache
+        try:
+            cache.incr(VERSIONS_EPOCH_KEY)
+        except ValueError:
+            # key is not in cache
+            self.get_epoch()
+
+    def refresh_local_cache(self):
+        """ Updates the versions changed by other processes in local cache,
+        if the epoch in cache has changed since it was last checked.
+
+        No lock is taken, threads checking at the same time only update
+        the same versions.
+        """
+        manager_class = CacheDynamicVersionManager
+        interval = flash_settings.DYNAMIC_VERSION_CHECK_INTERVAL
+        if interval is None:
+            manager_class._next_check_at = float('inf')
+            return
+        manager_class._next_check_at = time.time() + interval
+        epoch = self.get_epoch()
+        if epoch == manager_class._epoch:
+            return
+        if self._local_cache:
+            cache_versions = CacheDynamicVersion.objects.values_list(
+                'cache_type', 'cache_name', 'version')
+            for cache_type, cache_name, version in cache_versions:
+                cache_class_key = '%s:%s' % (cache_type, cache_name)
+                if self._local_cache.get(cache_class_key) != version:
+                    self._local_cache[cache_class_key] = version
+        manager_class._epoch = epoch
 
     def populate_local_cache(self):
         from flash.caches import CacheDynamicVersionListCache
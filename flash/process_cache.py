@@ -0,0 +1,104 @@
+""" Process wide in-memory tier in front of the cache backend.
+
+Cache classes opt in by setting `process_cache_timeout`. Their fresh values
+are kept pickled in a bounded LRU store of the process for that many seconds,
+so the hottest keys don't go to memcached on every read.
+"""
+import time
+import threading
+
+from collections import OrderedDict
+
+from six.moves import cPickle as pickle
+
+from flash import settings as flash_settings
+
+
+class ProcessCache(object):
+    """ LRU store of pickled values with per entry expiry.
+
+        Total size of pickled values is kept under max_size bytes.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _delete(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+    def get_many(self, keys):
+        """ Returns dict of key values found in process cache.
+
+        Entries which have expired or whose cache class's dynamic version
+        has changed are dropped.
+        """
+        from flash.models import CacheDynamicVersion
+
+        result_dict = {}
+        if not self.entries:
+            return result_dict
+        now = time.time()
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is None:
+                    continue
+                pickled, expires_at, cache_class, version = entry
+                if expires_at < now:
+                    self._delete(key)
+                    continue
+                result_dict[key] = entry
+        for key, entry in list(result_dict.items()):
+            pickled, expires_at, cache_class, version = entry
+            current_version = CacheDynamicVersion.objects.get_version_of(
+                    cache_class)
+            if current_version is not None and current_version != version:
+                self.delete_many([key])
+                del result_dict[key]
+                continue
+            result_dict[key] = pickle.loads(pickled)
+        with self.lock:
+            for key in result_dict:
+                if key in self.entries:
+                    # mark as recently used
+                    self.entries[key] = self.entries.pop(key)
+        return result_dict
+
+    def set(self, key, value, timeout, cache_class, add=False):
+        """ Stores the value (WrappedValue) for timeout seconds.
+
+        If add is True then value is not stored if key already exists.
+        """
+        if add and key in self.entries:
+            return
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(pickled) > self.max_size:
+            return
+        entry = (pickled, time.time() + timeout, cache_class, value.version)
+        with self.lock:
+            self._delete(key)
+            self.entries[key] = entry
+            self.size += len(pickled)
+            while self.size > self.max_size:
+                # evict least recently used entries
+                oldest_key = next(iter(self.entries))
+                self._delete(oldest_key)
+
+    def delete_many(self, keys):
+        if not self.entries:
+            return
+        with self.lock:
+            for key in keys:
+                self._delete(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+process_cache = ProcessCache(flash_settings.PROCESS_CACHE_MAX_SIZE)
@@ -0,0 +1,58 @@
+""" Bounded pool of threads to refresh stale cache values in background.
+"""
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+
+from flash import settings as flash_settings
+
+
+logger = logging.getLogger('flash')
+
+
+class RefreshPool(object):
+    """ Runs submitted functions in at most max_workers threads.
+        At most max_pending functions can be waiting or running at a time.
+    """
+    def __init__(self, max_workers, max_pending):
+        self.max_workers = max_workers
+        self.pending = threading.BoundedSemaphore(max_pending)
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def get_executor(self):
+        if self.executor is None:
+            with self.lock:
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(self.max_workers)
+        return self.executor
+
+    def submit(self, func, *args, **kwargs):
+        """ Schedules func to be called with given args and kwargs.
+        Returns False if pool is full and func is not scheduled.
+        """
+        if not self.pending.acquire(False):
+            return False
+        try:
+            self.get_executor().submit(self.run, func, args, kwargs)
+        except Exception:
+            self.pending.release()
+            raise
+        return True
+
+    def run(self, func, args, kwargs):
+        close_old_connections()
+        try:
+            func(*args, **kwargs)
+        except Exception:
+            logger.exception('Flash: Background refresh failed')
+        finally:
+            close_old_connections()
+            self.pending.release()
+
+
+refresh_pool = RefreshPool(flash_settings.REFRESH_POOL_SIZE,
+                           flash_settings.REFRESH_POOL_MAX_PENDING)
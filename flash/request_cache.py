@@ -0,0 +1,90 @@
+""" Request scoped in-process memo of cache values.
+
+While a request cache is active for the current thread (set up by
+RequestCacheMiddleware or by `use_request_cache()` context manager), every
+value fetched from or written to the cache backend by flash is remembered
+till the end of the request. So repeated cache queries for the same key
+don't make network calls again.
+"""
+import threading
+from contextlib import contextmanager
+
+
+_local = threading.local()
+
+_unknown = object()
+
+
+class RequestCache(object):
+    """ Dict of cache key and value seen during current request.
+
+        Keys which are known to be absent in cache backend are stored
+        with ABSENT as value.
+    """
+    ABSENT = object()
+
+    def __init__(self):
+        self.data = {}
+
+    def get_many(self, keys):
+        """ Returns dict of key values found in request cache and list of
+        keys which are not known to request cache.
+        """
+        result_dict = {}
+        unknown_keys = []
+        for key in keys:
+            value = self.data.get(key, _unknown)
+            if value is _unknown:
+                unknown_keys.append(key)
+            elif value is not self.ABSENT:
+                result_dict[key] = value
+        return result_dict, unknown_keys
+
+    def set_many(self, key_value_dict):
+        self.data.update(key_value_dict)
+
+    def set_absent(self, keys):
+        for key in keys:
+            self.data[key] = self.ABSENT
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def clear(self):
+        self.data.clear()
+
+
+def get_request_cache():
+    """ Returns the request cache active in current thread or None
+    """
+    return getattr(_local, 'request_cache', None)
+
+
+def activate():
+    """ Starts a new request cache for current thread and returns it
+    """
+    _local.request_cache = RequestCache()
+    return _local.request_cache
+
+
+def deactivate():
+    _local.request_cache = None
+
+
+@contextmanager
+def use_request_cache():
+    """ Context manager to use request cache outside of request/response
+    cycle. E.g. in celery tasks.
+
+    If a request cache is already active then it's reused.
+    """
+    request_cache = get_request_cache()
+    if request_cache is not None:
+        yield request_cache
+        return
+    request_cache = activate()
+    try:
+        yield request_cache
+    finally:
+        deactivate()
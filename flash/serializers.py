@@ -0,0 +1,171 @@
+""" Serializers which can be put as `serializer` on cache classes.
+"""
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+from six.moves import cPickle as pickle
+
+from django.db import models
+
+from flash import settings as flash_settings
+
+try:
+    from django.apps import apps
+    get_model = apps.get_model
+except ImportError:
+    from django.db.models import get_model
+
+
+class SchemaChanged(Exception):
+    """ Raised when a cached value can't be loaded as its model has changed
+    since it was cached.
+    """
+
+
+class ModelInstanceSerializer(object):
+    """ Serializes model instances, or list of them, compactly.
+
+        An instance is stored as tuple of its model label, db, a fingerprint
+        of its concrete fields and tuple of their values. Instance is rebuilt
+        using Model.from_db. Instances with deferred fields and other values
+        are stored as they are.
+    """
+    def __init__(self):
+        self._model_schemas = {}
+
+    def get_schema(self, model):
+        """ Returns (label, fingerprint, attnames) of model
+        """
+        schema = self._model_schemas.get(model)
+        if schema is None:
+            opts = model._meta
+            label = '%s.%s' % (opts.app_label, opts.object_name)
+            attnames = tuple(field.attname for field in opts.concrete_fields)
+            fingerprint = zlib.crc32(
+                ('%s:%s' % (label, ','.join(attnames))).encode(
+                    'utf-8')) & 0xffffffff
+            schema = (label, fingerprint, attnames)
+            self._model_schemas[model] = schema
+        return schema
+
+    def dump_instance(self, instance):
+        if not isinstance(instance, models.Model):
+            return instance
+        label, fingerprint, attnames = self.get_schema(type(instance))
+        instance_dict = instance.__dict__
+        try:
+            values = tuple(instance_dict[attname] for attname in attnames)
+        except KeyError:
+            # deferred field
+            return instance
+        return InstanceData(label, instance._state.db, fingerprint, values)
+
+    def load_instance(self, value):
+        if not isinstance(value, InstanceData):
+            return value
+        model = get_model(*value.label.split('.'))
+        _, fingerprint, attnames = self.get_schema(model)
+        if fingerprint != value.fingerprint:
+            raise SchemaChanged(value.label)
+        if hasattr(model, 'from_db'):
+            return model.from_db(value.db, attnames, value.values)
+        instance = model(*value.values)
+        instance._state.adding = False
+        instance._state.db = value.db
+        return instance
+
+    def dumps(self, value):
+        if isinstance(value, list):
+            return [self.dump_instance(i) for i in value]
+        return self.dump_instance(value)
+
+    def loads(self, value):
+        if isinstance(value, list):
+            return [self.load_instance(i) for i in value]
+        return self.load_instance(value)
+
+
+class InstanceData(tuple):
+    """ Compact form of a model instance in cache
+    """
+    __slots__ = ()
+
+    def __new__(cls, label, db, fingerprint, values):
+        return tuple.__new__(cls, (label, db, fingerprint, values))
+
+    def __getnewargs__(self):
+        return tuple(self)
+
+    label = property(lambda self: self[0])
+    db = property(lambda self: self[1])
+    fingerprint = property(lambda self: self[2])
+    values = property(lambda self: self[3])
+
+
+class CompressingSerializer(object):
+    """ Pickles values and compresses those bigger than threshold bytes.
+
+        First byte of the serialized value tells if rest of it is compressed
+        and how. Serialized values are kept small for cache backend but
+        small values are not compressed to save cpu.
+
+        serializer: another serializer whose output is compressed.
+        E.g. CompressingSerializer(serializer=ModelInstanceSerializer())
+    """
+    RAW = b'0'
+    ZLIB = b'1'
+    LZMA = b'2'
+
+    DEFAULT_THRESHOLD = 1024
+
+    def __init__(self, threshold=None, method=None, serializer=None):
+        if threshold is None:
+            threshold = flash_settings.COMPRESS_THRESHOLD
+        if threshold is None:
+            threshold = self.DEFAULT_THRESHOLD
+        if method is None:
+            method = flash_settings.COMPRESS_METHOD
+        if method == 'lzma' and lzma is None:
+            raise ValueError('lzma module is not available')
+        if method not in ('zlib', 'lzma'):
+            raise ValueError('Unknown compression method: %s' % method)
+        self.threshold = threshold
+        self.method = method
+        self.serializer = serializer
+
+    def dumps(self, value):
+        if self.serializer:
+            value = self.serializer.dumps(value)
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) <= self.threshold:
+            return self.RAW + data
+        if self.method == 'lzma':
+            return self.LZMA + lzma.compress(data)
+        return self.ZLIB + zlib.compress(data)
+
+    def loads(self, value):
+        if isinstance(value, bytes):
+            marker, data = value[:1], value[1:]
+            if marker == self.RAW:
+                value = pickle.loads(data)
+            elif marker == self.ZLIB:
+                value = pickle.loads(zlib.decompress(data))
+            elif marker == self.LZMA:
+                value = pickle.loads(lzma.decompress(data))
+        # else value was cached before compression was turned on
+        if self.serializer:
+            value = self.serializer.loads(value)
+        return value
+
+
+def get_default_serializer():
+    """ Returns serializer to be used by cache classes which don't set their
+    own, as per FLASH_COMPRESS_THRESHOLD setting.
+    """
+    if flash_settings.COMPRESS_THRESHOLD is None:
+        return None
+    return CompressingSerializer()
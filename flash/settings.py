@@ -1,6 +1,6 @@
 from django.conf import settings
 
-from flash.constants import CACHE_TIME_WEEK, CACHE_TIME_30S
+from flash.constants import CACHE_TIME_WEEK, CACHE_TIME_30S, CACHE_TIME_5S
 
 FLASH_APPS = getattr(settings, 'FLASH_APPS', settings.INSTALLED_APPS)
 CACHE_NAME = getattr(settings, 'FLASH_CACHE', 'default')
@@ -8,6 +8,48 @@ DEFAULT_TIMEOUT = getattr(settings, 'FLASH_DEFAULT_TIMEOUT', CACHE_TIME_WEEK)
 DONT_USE_CACHE = getattr(settings, 'FLASH_DONT_USE_CACHE', False)
 WRITE_LOCK_TIMEOUT = getattr(settings, 'FLASH_WRITE_LOCK_TIMEOUT',
                             CACHE_TIME_30S)
+# default lease_timeout and lease_poll_interval of cache classes
+LEASE_TIMEOUT = getattr(settings, 'FLASH_LEASE_TIMEOUT', None)
+LEASE_POLL_INTERVAL = getattr(settings, 'FLASH_LEASE_POLL_INTERVAL', 0.05)
+# seconds a thread waits for other thread getting value for same key,
+# None to not coalesce
+SINGLE_FLIGHT_TIMEOUT = getattr(settings, 'FLASH_SINGLE_FLIGHT_TIMEOUT', None)
+# threads refreshing values of caches with REVALIDATE invalidation
+REFRESH_POOL_SIZE = getattr(settings, 'FLASH_REFRESH_POOL_SIZE', 4)
+# refreshes which can be waiting in pool, above it values are refreshed inline
+REFRESH_POOL_MAX_PENDING = getattr(settings, 'FLASH_REFRESH_POOL_MAX_PENDING',
+                                   100)
+# threads getting values from fallback methods (E.g. db) for asyncio and
+# parallel fallbacks
+FALLBACK_POOL_SIZE = getattr(settings, 'FLASH_FALLBACK_POOL_SIZE', 4)
+# whether BatchCacheQuery gets values of different cache classes and dbs
+# from fallback methods concurrently by default
+PARALLEL_FALLBACKS = getattr(settings, 'FLASH_PARALLEL_FALLBACKS', False)
+# max bytes of pickled values kept in process cache
+PROCESS_CACHE_MAX_SIZE = getattr(settings, 'FLASH_PROCESS_CACHE_MAX_SIZE',
+                                 16 * 1024 * 1024)
+# values bigger than these many pickled bytes are compressed by all cache
+# classes not having their own serializer, None to not compress
+COMPRESS_THRESHOLD = getattr(settings, 'FLASH_COMPRESS_THRESHOLD', None)
+# 'zlib' or 'lzma'
+COMPRESS_METHOD = getattr(settings, 'FLASH_COMPRESS_METHOD', 'zlib')
+# escape keys the older way (md5 of whole long keys) to keep the keys
+# cached by older versions of flash during rollout
+LEGACY_KEY_ESCAPE = getattr(settings, 'FLASH_LEGACY_KEY_ESCAPE', False)
+# rows of an updated queryset read at a time to invalidate their caches
+UPDATE_INVALIDATION_CHUNK_SIZE = getattr(
+    settings, 'FLASH_UPDATE_INVALIDATION_CHUNK_SIZE', 2000)
+# seconds after invalidation of a key in which values got from db aren't
+# cached, as db may still return the old values
+STALE_DATA_WINDOW = getattr(settings, 'FLASH_STALE_DATA_WINDOW', 0.3)
+# whether keys invalidated inside transaction.atomic blocks are invalidated
+# on commit, False for tests run in transactions which are never committed
+# (E.g. django.test.TestCase)
+DEFER_INVALIDATION = getattr(settings, 'FLASH_DEFER_INVALIDATION', True)
+# seconds after which a process checks whether dynamic versions were changed
+# by other processes, None to not check
+DYNAMIC_VERSION_CHECK_INTERVAL = getattr(
+    settings, 'FLASH_DYNAMIC_VERSION_CHECK_INTERVAL', CACHE_TIME_5S)
 
 def default_db_discoverer_func(model):
     return 'default'
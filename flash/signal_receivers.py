@@ -1,42 +1,195 @@
 import time
-from copy import deepcopy
 
+from django.db import models
+from django.db.models.base import ModelState
 from django.db.models.signals import post_save, pre_delete, m2m_changed
-from django.dispatch import receiver
 from django.conf import settings
 
 from flash.base import (cache, StaleData, BaseModelQueryCacheMeta,
-                        InvalidationType)
+                        InvalidationType, Cache, get_invalidation_attnames,
+                        refresh_generations)
+from flash import settings as flash_settings
 from flash.signals import queryset_update
+from flash.fields_diff import save_state, connect_statediff_receivers
+from flash.request_cache import get_request_cache
+from flash.deferred_invalidation import defer_invalidation
+from flash.process_cache import process_cache
 from flash.constants import CACHE_TIME_S
 
 
-def get_cache_keys_to_be_invalidated(model, instance, signal, using):
-    cache_classes = BaseModelQueryCacheMeta.model_caches[model]
+def get_cache_keys_to_be_invalidated(model, instance, signal, using,
+                                     refresh=True):
+    """ Returns keys to be unset, stale keys to be set for dynamic
+    invalidation and dict of timeout and dict of keys and values to be set
+    for RESET invalidation.
+
+    Current generations of cache classes using them are got from cache
+    first, unless refresh is False.
+    """
+    invalidation_plan = BaseModelQueryCacheMeta.invalidation_plans.get(
+            model, ())
+    if refresh:
+        refresh_model_generations(model)
 
     unset_cache_keys = []
     dynamic_cache_keys = []
+    reset_values = {}
 
-    for cache_class in cache_classes:
+    for step in invalidation_plan:
+        cache_class = step.cache_class
         if cache_class.invalidation == InvalidationType.OFF:
             continue
+        if (signal in ['post_save', 'instance_update'] and
+                is_untouched(step, instance)):
+            continue
         try:
-            cache_class_instance = cache_class()
-            cache_keys = list(cache_class_instance.get_keys_to_be_invalidated(
-                instance, signal, using))
-            if cache_class.invalidation == InvalidationType.UNSET:
-                unset_cache_keys.extend(cache_keys)
-            elif cache_class.invalidation == InvalidationType.DYNAMIC:
-                cache_keys = [cache_class_instance.get_stale_key(key)
-                    for key in cache_keys]
+            if (step.key_attnames is not None and
+                    isinstance(instance, cache_class.model)):
+                cache_keys = get_keys_from_attnames(
+                    step, instance, using)
+            else:
+                cache_keys = list(
+                    cache_class().get_keys_to_be_invalidated(
+                        instance, signal, using))
+            if step.is_dynamic:
+                cache_keys = [Cache.get_stale_key(key) for key in cache_keys]
                 dynamic_cache_keys.extend(cache_keys)
+            elif (cache_class.invalidation == InvalidationType.RESET and
+                    signal == 'post_save' and can_reset(step, instance)):
+                # first key is of current values of key fields, others are
+                # of old values
+                key = cache_keys[0]
+                reset_values.setdefault(cache_class.timeout, {})[key] = (
+                    cache_class().get_reset_value(instance))
+                unset_cache_keys.extend(cache_keys[1:])
+            else:
+                # UNSET, and RESET when instance can't be written
+                unset_cache_keys.extend(cache_keys)
         except Exception:
             if settings.DEBUG:
                 raise
-    return unset_cache_keys, dynamic_cache_keys
+    return unset_cache_keys, dynamic_cache_keys, reset_values
+
+
+def refresh_model_generations(model):
+    """ Gets current generations of cache classes invalidated on model which
+    use generations, so that keys of current generation get invalidated.
+    """
+    invalidation_plan = BaseModelQueryCacheMeta.invalidation_plans.get(
+            model, ())
+    refresh_generations([step.cache_class for step in invalidation_plan
+                         if step.cache_class.use_generation])
+
+
+def can_reset(step, instance):
+    """ Returns whether saved instance can be written to keys of step's
+    cache class as it is.
+    """
+    cache_class = step.cache_class
+    if (step.key_attnames is None or
+            not isinstance(instance, cache_class.model)):
+        return False
+    if not getattr(cache_class, 'is_simple', False):
+        return False
+    if not hasattr(cache_class, 'get_reset_value'):
+        return False
+    instance_dict = instance.__dict__
+    for field in instance._meta.concrete_fields:
+        # deferred fields are not loaded
+        if field.attname not in instance_dict:
+            return False
+        value = instance_dict[field.attname]
+        # expressions like F('num') + 1 are known only in db after save
+        if hasattr(value, 'resolve_expression'):
+            return False
+        # values not of field's type (E.g. '3' for an integer field) are
+        # read from db as another value
+        try:
+            python_value = field.to_python(value)
+        except Exception:
+            return False
+        if type(python_value) is not type(value) or python_value != value:
+            return False
+    return True
+
+
+def is_untouched(step, instance):
+    """ Returns True if saving instance changed none of the fields values of
+    step's cache class depend on.
+    """
+    if step.depends_on_attnames is None:
+        return False
+    if not isinstance(instance, models.Model):
+        return False
+    statediff = instance.__dict__.get('_statediff')
+    if statediff is None or statediff.diff is None:
+        return False
+    if not step.depends_on_attnames.issubset(statediff.attnames):
+        # instance was loaded before these fields got tracked
+        return False
+    return step.depends_on_attnames.isdisjoint(statediff.diff)
+
+
+def get_keys_from_attnames(step, instance, using):
+    """ Returns keys of step's cache class for current and previous values
+    of key fields in instance.
+    """
+    state_diff = instance.get_state_diff()
+    params = []
+    params_pre = []
+    for attname in step.key_attnames:
+        value = getattr(instance, attname)
+        params.append(value)
+        if attname in state_diff and 'pre' in state_diff[attname]:
+            params_pre.append(state_diff[attname]['pre'])
+        else:
+            params_pre.append(value)
+    build_key = step.cache_class.key_builder
+    keys = [build_key(None, using, params, {})]
+    if params_pre != params:
+        keys.append(build_key(None, using, params_pre, {}))
+    return keys
+
+
+def invalidate_caches(unset_cache_keys, dynamic_cache_keys,
+                      reset_values=None, using=None):
+    """ Invalidates given keys. Inside a transaction they are invalidated
+    once it commits.
+    """
+    reset_values = reset_values or {}
+    evict_local_caches(unset_cache_keys, dynamic_cache_keys, reset_values)
+    if defer_invalidation(unset_cache_keys, dynamic_cache_keys,
+                          reset_values, using, invalidate_caches_now):
+        return
+    set_stale_data(unset_cache_keys, dynamic_cache_keys)
+    set_reset_values(reset_values)
 
 
-def invalidate_caches(unset_cache_keys, dynamic_cache_keys):
+def invalidate_caches_now(unset_cache_keys, dynamic_cache_keys,
+                          reset_values):
+    evict_local_caches(unset_cache_keys, dynamic_cache_keys, reset_values)
+    set_stale_data(unset_cache_keys, dynamic_cache_keys)
+    set_reset_values(reset_values)
+
+
+def evict_local_caches(unset_cache_keys, dynamic_cache_keys,
+                       reset_values):
+    reset_keys = [key for key_value_dict in reset_values.values()
+                  for key in key_value_dict]
+    request_cache = get_request_cache()
+    if request_cache is not None:
+        # evict keys so that next read in this request gets the stale data
+        # from cache and reads its own write.
+        request_cache.delete_many(unset_cache_keys)
+        request_cache.delete_many(dynamic_cache_keys)
+        request_cache.delete_many(reset_keys)
+    process_cache.delete_many(unset_cache_keys)
+    process_cache.delete_many(reset_keys)
+    process_cache.delete_many([Cache.get_key_of_stale_key(key)
+                               for key in dynamic_cache_keys])
+
+
+def set_stale_data(unset_cache_keys, dynamic_cache_keys):
     IS_TEST = getattr(settings, 'TEST', False)
     if settings.DEBUG and not IS_TEST and unset_cache_keys:
         print ('Flash: Invalidating cache keys (unsetting)', unset_cache_keys)
@@ -51,19 +204,22 @@ def invalidate_caches(unset_cache_keys, dynamic_cache_keys):
         key_value_map = {key: stale_data for key in dynamic_cache_keys}
         cache.set_many(key_value_map, timeout=None)
 
-@receiver(post_save)
+
+def set_reset_values(reset_values):
+    for timeout, key_value_dict in reset_values.items():
+        cache.set_many(key_value_dict, timeout=timeout)
+
 def instance_post_save_receiver(sender, instance, **kwargs):
     try:
         model = sender
         cache_keys_tuple = get_cache_keys_to_be_invalidated(
                 model, instance, 'post_save', kwargs['using'])
-        invalidate_caches(*cache_keys_tuple)
+        invalidate_caches(*cache_keys_tuple, using=kwargs['using'])
     except:
         if settings.DEBUG:
             raise
 
 
-@receiver(m2m_changed)
 def instance_m2m_changed_receiver(sender, instance, action, reverse, model,
         pk_set, **kwargs):
     try:
@@ -72,25 +228,23 @@ def instance_m2m_changed_receiver(sender, instance, action, reverse, model,
         obj = (instance, reverse, model, pk_set)
         cache_keys_tuple = get_cache_keys_to_be_invalidated(
                 sender, obj, 'm2m_changed', kwargs['using'])
-        invalidate_caches(*cache_keys_tuple)
+        invalidate_caches(*cache_keys_tuple, using=kwargs['using'])
     except:
         if settings.DEBUG:
             raise
 
 
-@receiver(pre_delete)
 def instance_pre_delete_receiver(sender, instance, **kwargs):
     try:
         model = sender
         cache_keys_tuple = get_cache_keys_to_be_invalidated(
                 model, instance, 'pre_delete', kwargs['using'])
-        invalidate_caches(*cache_keys_tuple)
+        invalidate_caches(*cache_keys_tuple, using=kwargs['using'])
     except:
         if settings.DEBUG:
             raise
 
 
-@receiver(queryset_update)
 def queryset_update_receiver(sender, queryset, update_kwargs, **kwargs):
     try:
         model = sender
@@ -98,27 +252,87 @@ def queryset_update_receiver(sender, queryset, update_kwargs, **kwargs):
             return
         if not update_kwargs and kwargs.get('force', False) is False:
             return
+        using = kwargs['using']
+        chunk_size = flash_settings.UPDATE_INVALIDATION_CHUNK_SIZE
+        attnames = get_invalidation_attnames(model)
+        if attnames is None:
+            # some cache class needs whole instances
+            instances = iterate_in_chunks(queryset, chunk_size)
+        else:
+            instances = (
+                build_instance(model, attnames, values, using)
+                for values in iterate_in_chunks(
+                    queryset.values_list(*attnames), chunk_size))
+        refresh_model_generations(model)
         unset_cache_keys = []
         dynamic_cache_keys = []
-        for instance in queryset:
+        for i, instance in enumerate(instances, 1):
             try:
-                instance = deepcopy(instance)
                 update_statediff(instance, update_kwargs)
-                unset_keys, dynamic_keys = get_cache_keys_to_be_invalidated(
-                        model, instance, 'instance_update',
-                        kwargs['using'])
+                unset_keys, dynamic_keys, _ = (
+                    get_cache_keys_to_be_invalidated(
+                        model, instance, 'instance_update', using,
+                        refresh=False))
                 unset_cache_keys.extend(unset_keys)
                 dynamic_cache_keys.extend(dynamic_keys)
             except:
                 if settings.DEBUG:
                     raise
-        invalidate_caches(unset_cache_keys, dynamic_cache_keys)
+            if i % chunk_size == 0:
+                invalidate_caches(unset_cache_keys, dynamic_cache_keys,
+                                  using=using)
+                unset_cache_keys = []
+                dynamic_cache_keys = []
+        invalidate_caches(unset_cache_keys, dynamic_cache_keys, using=using)
     except:
         if settings.DEBUG:
             raise
 
 
+def iterate_in_chunks(queryset, chunk_size):
+    try:
+        return queryset.iterator(chunk_size=chunk_size)
+    except TypeError:
+        # Django < 2.0
+        return queryset.iterator()
+
+
+def build_instance(model, attnames, values, using):
+    """ Returns instance of model having only given attnames set, to be used
+    for getting keys to be invalidated.
+    """
+    instance = model.__new__(model)
+    instance.__dict__.update(zip(attnames, values))
+    instance._state = ModelState()
+    instance._state.db = using
+    instance._state.adding = False
+    save_state(instance)
+    return instance
+
+
 def update_statediff(instance, update_kwargs):
     for key, value in update_kwargs.items():
         setattr(instance, key, value)
     instance.create_state_diff()
+
+
+def connect_model_receivers(model):
+    """ Connects receivers invalidating caches when instances of given
+    model change, and keeping state diff of its instances.
+    """
+    connect_statediff_receivers(model)
+    post_save.connect(instance_post_save_receiver, sender=model)
+    pre_delete.connect(instance_pre_delete_receiver, sender=model)
+    m2m_changed.connect(instance_m2m_changed_receiver, sender=model)
+    queryset_update.connect(queryset_update_receiver, sender=model)
+
+
+def connect_receivers():
+    """ Connects receivers for all models on which caches get invalidated.
+    Called from FlashConfig.ready, after which receivers are connected
+    for models as cache classes get registered on them.
+    """
+    for model in list(BaseModelQueryCacheMeta.model_caches.keys()):
+        connect_model_receivers(model)
+    BaseModelQueryCacheMeta.model_registered_callbacks.append(
+        connect_model_receivers)
@@ -0,0 +1,92 @@
+""" Coalescing of concurrent fallback calls for same keys in a process.
+
+When threads of a process miss the same key at the same time, only the first
+one gets the value from fallback method. Others wait for its result.
+"""
+import copy
+import threading
+
+from django.db import transaction, DEFAULT_DB_ALIAS
+
+from flash import settings as flash_settings
+
+
+class Flight(object):
+    def __init__(self):
+        self.event = threading.Event()
+        # (is_exception, value or exception) pair, None if resolving failed
+        self.result = None
+
+
+class SingleFlight(object):
+    def __init__(self):
+        self.flights = {}
+        self.lock = threading.Lock()
+
+    def resolve_many(self, keys, resolve, timeout):
+        """ Returns list of (is_exception, value or exception) pairs for keys.
+
+        resolve is called with list of indexes of keys which are not being
+        resolved by other threads and has to return list of pairs for them.
+        Results of other keys are waited for at most timeout seconds,
+        after which they are resolved by this thread too. Keys which are
+        None are always resolved by this thread, and not shared.
+        """
+        own_flights = {}
+        other_flights = {}
+        with self.lock:
+            for i, key in enumerate(keys):
+                if key is None:
+                    own_flights[i] = Flight()
+                    continue
+                flight = self.flights.get(key)
+                if flight is None:
+                    flight = Flight()
+                    self.flights[key] = flight
+                    own_flights[i] = flight
+                else:
+                    other_flights[i] = flight
+
+        results = [None] * len(keys)
+        own_indexes = sorted(own_flights)
+        try:
+            if own_indexes:
+                for i, result in zip(own_indexes, resolve(own_indexes)):
+                    results[i] = result
+                    own_flights[i].result = result
+        finally:
+            with self.lock:
+                for i in own_indexes:
+                    if keys[i] is not None:
+                        self.flights.pop(keys[i], None)
+            for flight in own_flights.values():
+                flight.event.set()
+
+        for i, flight in other_flights.items():
+            flight.event.wait(timeout)
+            result = flight.result
+            if result is None:
+                # timed out or resolving failed in other thread
+                result = resolve([i])[0]
+            elif not result[0]:
+                # don't share the value between threads
+                result = (False, copy.deepcopy(result[1]))
+            results[i] = result
+        return results
+
+
+single_flight = SingleFlight()
+
+
+def resolve_once(keys, resolve, using=None):
+    """ Resolves the keys using single flight if it is on. See
+    SingleFlight.resolve_many.
+
+    It's off inside transactions, so that uncommitted changes of the
+    transaction are seen by its own queries.
+    """
+    timeout = flash_settings.SINGLE_FLIGHT_TIMEOUT
+    if (timeout is None or transaction.get_connection(
+            using or DEFAULT_DB_ALIAS).in_atomic_block):
+        return resolve(list(range(len(keys))))
+    return single_flight.resolve_many(keys, resolve, timeout)
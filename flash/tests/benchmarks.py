@@ -0,0 +1,107 @@
+""" Benchmarks to be run in django shell of a project with flash tests
+installed. E.g.
+
+    >>> from flash.tests.benchmarks import benchmark_serializer
+    >>> benchmark_serializer()
+"""
+import gc
+import pickle
+import timeit
+
+from django.db import models
+
+from flash import fields_diff
+from flash.serializers import ModelInstanceSerializer
+from flash.utils import memcache_key_escape
+
+from .models import ModelA, ModelC
+from .caches import BCacheOnNum
+
+
+def benchmark_serializer(instance=None, number=10000):
+    """ Prints bytes and microseconds per instance taken by pickle and by
+    ModelInstanceSerializer to dump and load a model instance.
+    """
+    if instance is None:
+        instance = ModelA.objects.create(num=1, text='hello')
+    serializer = ModelInstanceSerializer()
+    protocol = pickle.HIGHEST_PROTOCOL
+    paths = [
+        ('pickle', lambda value: value, lambda value: value),
+        ('compact', serializer.dumps, serializer.loads),
+    ]
+    for name, dumps, loads in paths:
+        data = pickle.dumps(dumps(instance), protocol)
+        dump_time = timeit.timeit(
+            lambda: pickle.dumps(dumps(instance), protocol), number=number)
+        load_time = timeit.timeit(
+            lambda: loads(pickle.loads(data)), number=number)
+        print('%-8s %6d bytes  dump %8.2f us  load %8.2f us' % (
+            name, len(data), dump_time * 1e6 / number,
+            load_time * 1e6 / number))
+
+
+def build_key_by_lookup(cache, using, args, kwargs):
+    """ Builds key the way it was done before key builders were compiled,
+    looking up fields for every key.
+    """
+    key = '%s__%s__%s' % (cache.cache_type, using, cache.__class__.__name__)
+    field_dict = cache.get_field_dict(*args, **kwargs)
+    for field_name in cache.key_fields:
+        field = cache.model._meta.get_field(field_name)
+        if field_name in field_dict:
+            value = field_dict[field_name]
+        else:
+            value = field_dict[field.attname]
+        if isinstance(value, models.Model):
+            value = getattr(value, value._meta.pk.attname)
+        key += '__%s' % str(value)
+    key += '__v%s' % cache.version
+    return memcache_key_escape(key)
+
+
+def benchmark_get_key(cache_class=BCacheOnNum, args=(1,), number=100000):
+    """ Prints microseconds per key taken by compiled key builder of given
+    cache class and by looking up fields for every key.
+    """
+    cache = cache_class()
+    using = cache.using
+    assert (cache.key_builder(cache, using, args, {}) ==
+            build_key_by_lookup(cache, using, args, {}))
+    for name, build_key in [
+            ('lookup', build_key_by_lookup),
+            ('compiled', cache.key_builder)]:
+        total_time = timeit.timeit(
+            lambda: build_key(cache, using, args, {}), number=number)
+        print('%-8s %8.2f us' % (name, total_time * 1e6 / number))
+
+
+def benchmark_statediff_memory(model=ModelC, number=100000):
+    """ Prints memory taken by loading number instances of model when state
+    of only tracked fields is kept and when state of all fields is kept.
+    Rows are created if there are less of them.
+    """
+    import tracemalloc
+
+    count = model.objects.count()
+    if count < number:
+        if model is ModelC:
+            a = ModelA.objects.create(num=1, text='hello')
+            b = a.modelb_set.create(num=1, text='hello')
+            model.objects.bulk_create([
+                ModelC(a=a, b=b, num=i) for i in range(number - count)])
+        else:
+            raise ValueError('Not enough rows of %s' % model.__name__)
+
+    tracked = fields_diff.tracked_attnames.get(model)
+    for name, attnames in [('all', None), ('tracked', tracked)]:
+        fields_diff.track_fields(model, attnames)
+        gc.collect()
+        tracemalloc.start()
+        instances = list(model.objects.all()[:number])
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print('%-8s %8.2f MB  %6d bytes per instance' % (
+            name, size / 1024.0 / 1024, size // len(instances)))
+        del instances
+    fields_diff.track_fields(model, tracked)
@@ -1,6 +1,10 @@
 from flash import (
         ModelCacheManager, InstanceCache, RelatedInstanceCache,
-        RelatedQuerysetCache)
+        QuerysetCache, QuerysetExistsCache, RelatedQuerysetCache,
+        InvalidationType)
+
+from flash.constants import CACHE_TIME_M
+from flash.serializers import ModelInstanceSerializer
 
 from .models import ModelA, ModelB, ModelC, ModelD
 
@@ -54,3 +58,52 @@ class AListCacheOnD(RelatedQuerysetCache):
     model = ModelD.a_list.through
     key_fields = ('modeld',)
     relation = 'modela'
+
+
+class ACacheOnText(InstanceCache):
+    model = ModelA
+    key_fields = ('text',)
+    process_cache_timeout = CACHE_TIME_M
+
+
+class BListCacheOnText(QuerysetCache):
+    model = ModelB
+    key_fields = ('text',)
+    invalidation = InvalidationType.REVALIDATE
+
+
+class CCacheOnNum(InstanceCache):
+    model = ModelC
+    key_fields = ('num',)
+    serializer = ModelInstanceSerializer()
+
+
+class BExistsOnA(QuerysetExistsCache):
+    model = ModelB
+    key_fields = ('a',)
+
+
+class BCacheOnCAText(RelatedInstanceCache):
+    model = ModelC
+    key_fields = ('a',)
+    relation = 'b'
+    depends_on_fields = ('b__text',)
+
+
+class BCacheOnTextReset(InstanceCache):
+    model = ModelB
+    key_fields = ('text',)
+    invalidation = InvalidationType.RESET
+
+
+class ACacheOnTextGeneration(InstanceCache):
+    model = ModelA
+    key_fields = ('text',)
+    use_generation = True
+
+
+class BCacheOnNumGeneration(InstanceCache):
+    model = ModelB
+    key_fields = ('num',)
+    select_related = ['a']
+    use_generation = True
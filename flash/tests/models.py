@@ -16,6 +16,7 @@ class ModelC(models.Model):
     a = models.ForeignKey(ModelA)
     b = models.ForeignKey(ModelB)
     num = models.IntegerField()
+    last_seen = models.IntegerField(default=0)
 
 
 class ModelD(models.Model):
@@ -1,19 +1,60 @@
 import time
-
-from flash.base import cache, BatchCacheQuery
-
-from .utils import TestCase
+import pickle
+import threading
+import unittest
+
+import six
+
+from django.db import transaction, connection
+from django.db.models import F
+
+from flash import settings as flash_settings
+from flash.base import (
+        cache, BatchCacheQuery, StaleData, EmulatedCAS, KeyFieldNotPassed,
+        BaseModelQueryCacheMeta, get_flight_key, get_invalidation_attnames)
+from flash.request_cache import use_request_cache
+from flash.process_cache import process_cache
+from flash import (
+        InstanceCache, RelatedInstanceCache, QuerysetExistsCache,
+        InvalidationType)
+from flash.single_flight import SingleFlight
+from flash.collector import LazyCollector, connect, Identity
+from flash.utils import memcache_key_escape
+from flash.models import CacheDynamicVersion, CacheDynamicVersionManager
+from flash.deferred_invalidation import get_pending_invalidations
+from flash.fields_diff import save_state
+from flash.serializers import (
+        ModelInstanceSerializer, InstanceData, CompressingSerializer)
+
+from .utils import TestCase, TransactionTestCase
 from .models import ModelA, ModelB, ModelC, ModelD
-from .caches import BCacheOnNum, AListCacheOnD
+from .caches import (
+        BCacheOnNum, AListCacheOnD, ACacheOnText, BListCacheOnText,
+        CCacheOnNum, BCacheOnCA, BExistsOnA, BCacheOnCAText,
+        BCacheOnTextReset, ACacheOnTextGeneration, BCacheOnNumGeneration)
+
 
+class CacheTestMixin(object):
+    def setUp(self):
+        # values got right after invalidation are cached, so tests don't
+        # wait for the stale window to pass
+        self._original_stale_data_window = flash_settings.STALE_DATA_WINDOW
+        flash_settings.STALE_DATA_WINDOW = 0
 
-class CacheTestCase(TestCase):
     def tearDown(self):
+        flash_settings.STALE_DATA_WINDOW = self._original_stale_data_window
         ModelA.objects.raw("DELETE FROM tests_modela")
         ModelB.objects.raw("DELETE FROM tests_modelb")
         ModelC.objects.raw("DELETE FROM tests_modelc")
         ModelD.objects.raw("DELETE FROM tests_modeld")
         cache.clear()
+        process_cache.clear()
+        # versions of cache classes are got again from flushed db
+        CacheDynamicVersionManager._local_cache.clear()
+
+
+class CacheTestCase(CacheTestMixin, TestCase):
+    pass
 
 
 class InstanceCacheTest(CacheTestCase):
@@ -64,6 +105,84 @@ class InstanceCacheTest(CacheTestCase):
 
         self.assertRaises(ModelB.DoesNotExist, get_from_cache)
 
+    def test_update(self):
+        a1 = ModelA.objects.create(num=1, text='hello')
+        a2 = ModelA.objects.create(num=2, text='world')
+
+        self.assertEqual(a1, ModelA.cache.get(num=1))
+        self.assertEqual(a1, ACacheOnText.get('hello'))
+        self.assertEqual(a2, ModelA.cache.get(num=2))
+
+        ModelA.objects.filter(id__in=[a1.id, a2.id]).update(text='bye')
+
+        self.assertEqual('bye', ModelA.cache.get(num=1).text)
+        self.assertRaises(ModelA.DoesNotExist, ACacheOnText.get, 'hello')
+
+        ModelA.objects.filter(id=a2.id).update(num=3)
+        self.assertRaises(ModelA.DoesNotExist, ModelA.cache.get, num=2)
+        self.assertEqual(a2, ModelA.cache.get(num=3))
+
+    def test_invalidation_plan(self):
+        plan = BaseModelQueryCacheMeta.invalidation_plans[ModelB]
+        steps = dict((step.cache_class, step) for step in plan)
+
+        self.assertEqual(('num',), steps[BCacheOnNum].key_attnames)
+        self.assertEqual(None, steps[BCacheOnCA].key_attnames)
+        self.assertTrue(steps[BCacheOnCA].needs_db_lookup)
+        self.assertTrue(steps[BListCacheOnText].is_dynamic)
+
+    def test_lease(self):
+        a = ModelA.objects.create(num=1, text='hello')
+        key = ModelA.cache.get_key(num=1)
+        cache_class = ModelA.cache.get_cache_class_for('num')
+
+        cache_class.lease_timeout = 1
+        try:
+            # some other process holds the lease, value is got from db
+            # after waiting for it
+            cache.add(cache_class.get_lease_key(key), True,
+                      timeout=cache_class.lease_timeout)
+            start_time = time.time()
+            self.assertEqual(a, ModelA.cache.get(num=1))
+            self.assertTrue(time.time() - start_time >= 1)
+
+            # lease is taken and released while getting value
+            cache.delete(key)
+            self.assertEqual(a, ModelA.cache.get(num=1))
+            self.assertEqual(None, cache.get(cache_class.get_lease_key(key)))
+
+            # lease is released when fallback method fails
+            def get_missing():
+                return ModelA.cache.get(num=2)
+            self.assertRaises(ModelA.DoesNotExist, get_missing)
+            missing_key = ModelA.cache.get_key(num=2)
+            self.assertEqual(
+                None, cache.get(cache_class.get_lease_key(missing_key)))
+
+            result = BatchCacheQuery({
+                1: ModelA.cache.get_query(num=2),
+            }).get(return_exceptions=True)
+            self.assertTrue(isinstance(result[1], ModelA.DoesNotExist))
+            self.assertEqual(
+                None, cache.get(cache_class.get_lease_key(missing_key)))
+        finally:
+            cache_class.lease_timeout = None
+
+    def test_get_many(self):
+        a1 = ModelA.objects.create(num=1, text='hello1')
+        a2 = ModelA.objects.create(num=2, text='hello2')
+
+        self.assertEqual({1: a1, 2: a2}, ModelA.cache.get_many(num=[1, 2, 3]))
+
+        key = ModelA.cache.get_key(num=1)
+        self.assertTrue(bool(cache.get(key)))
+
+        a1.text = 'bye'
+        a1.save()
+
+        result = ModelA.cache.get_many(num=[1, 2])
+        self.assertEqual('bye', result[1].text)
+
 
 class QuerysetCacheTest(CacheTestCase):
     def test_basic(self):
@@ -86,6 +205,65 @@ class QuerysetCacheTest(CacheTestCase):
         bs = list(ModelB.objects.filter(num=1))
         self.assertEqual(bs, ModelB.cache.filter(num=1))
 
+    def test_revalidate(self):
+        a = ModelA.objects.create(num=1, text='abc')
+        b1 = ModelB.objects.create(num=1, text='good', a=a)
+
+        self.assertEqual([b1], BListCacheOnText.get('good'))
+
+        b2 = ModelB.objects.create(num=2, text='good', a=a)
+
+        # stale value is returned and refreshed in background
+        self.assertEqual([b1], BListCacheOnText.get('good'))
+
+        key = BListCacheOnText.get_key('good')
+        BListCacheOnText().refresh(key, ('good',), {})
+        self.assertEqual([b1, b2], BListCacheOnText.get('good'))
+
+
+class KeyTest(CacheTestCase):
+    def test_basic1(self):
+        a = ModelA.objects.create(num=1, text='hello')
+        b = ModelB.objects.create(num=1, text='hello', a=a)
+
+        key = ModelB.cache.get_key(a=a)
+        self.assertEqual(key, ModelB.cache.get_key(a=a.id))
+        self.assertEqual(key, ModelB.cache.get_key(a_id=a.id))
+        self.assertTrue(key.endswith('__%s__v0' % a.id))
+        self.assertNotEqual(key, BCacheOnNum.get_key(b.num))
+
+        self.assertRaises(KeyFieldNotPassed, BCacheOnNum.get_key, text=1)
+
+    def test_overridden_get_key(self):
+        class ACacheOnNumX(InstanceCache):
+            model = ModelA
+            key_fields = ('num',)
+            invalidation = InvalidationType.OFF
+
+            def get_key(self, *args, **kwargs):
+                return super(ACacheOnNumX, self).get_key(
+                    *args, **kwargs) + '_x'
+
+        class ACacheOnNumY(ACacheOnNumX):
+            def get_key(self, *args, **kwargs):
+                return super(ACacheOnNumY, self).get_key(
+                    *args, **kwargs) + '_y'
+
+        key_x = ACacheOnNumX().get_key(1)
+        key_y = ACacheOnNumY().get_key(1)
+        self.assertTrue(key_x.endswith('__ACacheOnNumX__1__v0_x'))
+        self.assertTrue(key_y.endswith('__ACacheOnNumY__1__v0_x_y'))
+
+    def test_escape(self):
+        self.assertEqual('abc_1', memcache_key_escape('abc_1'))
+        self.assertEqual('a~IA==b', memcache_key_escape('a b'))
+        self.assertEqual('h~ww==~qQ==llo', memcache_key_escape(u'h\xe9llo'))
+
+        key = memcache_key_escape('x' * 300)
+        self.assertEqual(233, len(key))
+        self.assertTrue(key.startswith('x' * 200 + '~'))
+        self.assertNotEqual(key, memcache_key_escape('x' * 301))
+
 
 class RelatedInstanceCacheTest(CacheTestCase):
     def test_basic1(self):
@@ -150,8 +328,6 @@ class BatchCacheQueryTest(CacheTestCase):
         a = ModelA.objects.create(num=1, text='abc')
         b = ModelB.objects.create(num=2, text='def', a=a)
 
-        time.sleep(1)
-
         result = BatchCacheQuery({
             1: ModelA.cache.get_query(num=1),
             2: BCacheOnNum(num=2),
@@ -174,3 +350,655 @@ class BatchCacheQueryTest(CacheTestCase):
         }).get(none_on_exception=True)
 
         self.assertEqual(result, {1:a, 2:None})
+
+    def test_basic2(self):
+        a1 = ModelA.objects.create(num=1, text='abc')
+        a2 = ModelA.objects.create(num=2, text='def')
+
+        result = BatchCacheQuery({
+            1: ModelA.cache.get_query(num=1),
+            2: ModelA.cache.get_query(num=2),
+            3: ModelA.cache.get_query(num=3),
+        }).get(return_exceptions=True)
+
+        self.assertEqual(result[1], a1)
+        self.assertEqual(result[2], a2)
+        self.assertTrue(isinstance(result[3], ModelA.DoesNotExist))
+
+        b1 = ModelB.objects.create(num=1, text='good1', a=a1)
+        b2 = ModelB.objects.create(num=1, text='good2', a=a2)
+
+        result = BatchCacheQuery({
+            1: ModelB.cache.filter_query(num=1),
+            2: ModelB.cache.filter_query(num=2),
+        }).get()
+
+        self.assertEqual(result, {1: [b1, b2], 2: []})
+
+    def test_missing_values(self):
+        a_list = [ModelA.objects.create(num=i, text='abc')
+                  for i in range(1, 4)]
+        # version of cache class is loaded before
+        ModelA.cache.get_cache_class_for('num')().get_dynamic_version()
+        queries = dict((num, ModelA.cache.get_query(num=num))
+                       for num in [1, 2, 3, 997, 998, 999])
+
+        # values not got in the __in query don't exist
+        with self.assertNumQueries(1):
+            result = BatchCacheQuery(queries).get(return_exceptions=True)
+        self.assertEqual(a_list, [result[num] for num in [1, 2, 3]])
+        for num in [997, 998, 999]:
+            self.assertTrue(isinstance(result[num], ModelA.DoesNotExist))
+
+    def test_failing_values(self):
+        a = ModelA.objects.create(num=1, text='y')
+        ModelA.objects.create(num=2, text='x')
+        ModelA.objects.create(num=3, text='x')
+        ACacheOnText().get_dynamic_version()
+        queries = {
+            1: ACacheOnText('x'),
+            2: ACacheOnText('y'),
+            3: ACacheOnText('z'),
+        }
+
+        # failure of a query doesn't make others to be got again, only
+        # values not got from the __in query are got one by one
+        with self.assertNumQueries(3):
+            result = BatchCacheQuery(queries).get(return_exceptions=True)
+        self.assertTrue(isinstance(result[1],
+                                   ModelA.MultipleObjectsReturned))
+        self.assertEqual(a, result[2])
+        self.assertTrue(isinstance(result[3], ModelA.DoesNotExist))
+
+    def test_parallel(self):
+        a = ModelA.objects.create(num=1, text='abc')
+        b = ModelB.objects.create(num=2, text='def', a=a)
+
+        queries = {
+            1: ModelA.cache.get_query(num=1),
+            2: BCacheOnNum(num=2),
+            3: ModelA.cache.get_query(num=3),
+            4: ACacheOnText('abc'),
+        }
+        result = BatchCacheQuery(queries).get(return_exceptions=True,
+                                              parallel=True)
+        self.assertEqual(result[1], a)
+        self.assertEqual(result[2], b)
+        self.assertTrue(isinstance(result[3], ModelA.DoesNotExist))
+        self.assertEqual(result[4], a)
+
+        # values are set in cache, DoesNotExist too
+        result = BatchCacheQuery(queries).get(only_cache=True,
+                                              return_exceptions=True)
+        self.assertTrue(isinstance(result.pop(3), ModelA.DoesNotExist))
+        self.assertEqual(result, {1: a, 2: b, 4: a})
+
+
+class RequestCacheTest(CacheTestCase):
+    def test_basic1(self):
+        a = ModelA.objects.create(num=1, text='hello')
+
+        with use_request_cache() as request_cache:
+            self.assertEqual(a, ModelA.cache.get(num=1))
+
+            key = ModelA.cache.get_key(num=1)
+            self.assertTrue(key in request_cache.data)
+
+            # value is served from request cache even if memcached lost it
+            cache.delete(key)
+            self.assertEqual(a, ModelA.cache.get(num=1))
+
+    def test_basic2(self):
+        a = ModelA.objects.create(num=1, text='hello')
+
+        with use_request_cache():
+            self.assertEqual('hello', ModelA.cache.get(num=1).text)
+
+            a.text = 'bye'
+            a.save()
+
+            self.assertEqual('bye', ModelA.cache.get(num=1).text)
+
+
+class ReceiverTest(CacheTestCase):
+    def test_basic1(self):
+        a = ModelA.objects.create(num=1, text='hello')
+        d = ModelD.objects.create(num=1)
+
+        # state diff is kept only for models having caches
+        self.assertTrue(hasattr(ModelA.objects.get(id=a.id), '_statediff'))
+        self.assertFalse(hasattr(ModelD.objects.get(id=d.id), '_statediff'))
+
+    def test_statediff(self):
+        a = ModelA.objects.create(num=1, text='hello')
+        b = ModelB.objects.create(num=1, text='hello', a=a)
+        c = ModelC.objects.create(num=1, a=a, b=b)
+
+        # only fields used in keys are tracked
+        c = ModelC.objects.get(id=c.id)
+        self.assertEqual({'id': c.id, 'a_id': a.id, 'b_id': b.id, 'num': 1},
+                         c._statediff.state)
+        c.num = 2
+        c.create_state_diff()
+        self.assertEqual(1, c.get_state_diff()['num'].pre)
+
+        # state isn't pickled but saved again on unpickling
+        c = ModelC.objects.get(id=c.id)
+        c_copy = pickle.loads(pickle.dumps(c))
+        self.assertEqual(c._statediff.state, c_copy._statediff.state)
+        self.assertTrue(len(pickle.dumps(c._statediff)) < 50)
+
+    def test_invalidation_attnames(self):
+        self.assertTrue(BCacheOnNum.uses_default_invalidation())
+        self.assertTrue(BCacheOnCA.uses_default_related_invalidation())
+        self.assertFalse(BCacheOnCA.uses_default_invalidation())
+
+        # all fields are tracked when any way of getting keys to be
+        # invalidated is overridden
+        class BCacheOnCAOwnParams(RelatedInstanceCache):
+            model = ModelC
+            key_fields = ('a',)
+            relation = 'b'
+            invalidation = InvalidationType.OFF
+
+            def get_invalidation_params_list(self, instance, signal):
+                return []
+
+        self.assertFalse(
+            BCacheOnCAOwnParams.uses_default_related_invalidation())
+        BCacheOnCAOwnParams.invalidation = InvalidationType.DYNAMIC
+        try:
+            self.assertEqual(None, get_invalidation_attnames(ModelC))
+        finally:
+            BCacheOnCAOwnParams.invalidation = InvalidationType.OFF
+        self.assertEqual(set(['id', 'a_id', 'b_id', 'num']),
+                         set(get_invalidation_attnames(ModelC)))
+
+
+class DependsOnFieldsTest(CacheTestCase):
+    def test_basic1(self):
+        a1 = ModelA.objects.create(num=1, text='hello')
+        a2 = ModelA.objects.create(num=2, text='hello')
+        b = ModelB.objects.create(num=1, text='hello', a=a1)
+
+        self.assertTrue(BExistsOnA.get(a1))
+        key = BExistsOnA.get_key(a1)
+        self.assertEqual((), BExistsOnA.get_depends_on_fields())
+
+        # existance doesn't depend on text
+        b.text = 'bye'
+        b.save()
+        self.assertFalse(isinstance(cache.get(key), StaleData))
+
+        b.a = a2
+        b.save()
+        self.assertTrue(isinstance(cache.get(key), StaleData))
+        self.assertFalse(BExistsOnA.get(a1))
+
+        # not inferred when queryset may filter on other fields
+        class BNumExistsOnA(QuerysetExistsCache):
+            model = ModelB
+            key_fields = ('a',)
+            invalidation = InvalidationType.OFF
+
+            def get_queryset(self):
+                return ModelB.objects.filter(num__gt=0)
+
+        self.assertEqual(None, BNumExistsOnA.get_depends_on_fields())
+
+    def test_basic2(self):
+        a = ModelA.objects.create(num=1, text='hello')
+        b = ModelB.objects.create(num=1, text='hello', a=a)
+        c = ModelC.objects.create(num=1, a=a, b=b)
+
+        self.assertEqual(b, BCacheOnCAText.get(a))
+        key = BCacheOnCAText.get_key(a)
+        self.assertEqual(frozenset(['text']),
+                         BCacheOnCAText.get_depends_on_attnames(ModelB))
+
+        c.last_seen = 10
+        c.save()
+        self.assertFalse(isinstance(cache.get(key), StaleData))
+
+        b.num = 2
+        b.save()
+        self.assertFalse(isinstance(cache.get(key), StaleData))
+
+        b.text = 'bye'
+        b.save()
+        self.assertEqual('bye', BCacheOnCAText.get(a).text)
+
+    def test_deferred_field(self):
+        a = ModelA.objects.create(num=1, text='hello')
+        b = ModelB.objects.create(num=1, text='hello', a=a)
+        ModelC.objects.create(num=1, a=a, b=b)
+        self.assertEqual('hello', BCacheOnCAText.get(a).text)
+        key = BCacheOnCAText.get_key(a)
+
+        # change of field not loaded before can't be known to be untouched.
+        # On Django < 1.10 deferred instances are of another class, whose
+        # saves don't send signals to receivers of the model, so deferred
+        # field is made here as Django 1.10+ does.
+        b = ModelB.objects.get(id=b.id)
+        del b.__dict__['text']
+        save_state(b)
+        b.text = 'bye'
+        b.save()
+        self.assertTrue(isinstance(cache.get(key), StaleData))
+        self.assertEqual('bye', BCacheOnCAText.get(a).text)
+
+
+class ResetInvalidationTest(CacheTestCase):
+    def test_basic1(self):
+        a = ModelA.objects.create(num=1, text='hello')
+        b = ModelB.objects.create(num=1, text='hello', a=a)
+        key = BCacheOnTextReset.get_key('hello')
+
+        # saved instance is written to cache
+        self.assertEqual(b, cache.get(key).value)
+
+        b.num = 2
+        b.save()
+        self.assertEqual(2, cache.get(key).value.num)
+        self.assertEqual(2, BCacheOnTextReset.get('hello').num)
+
+        # key of old value is unset
+        b.text = 'bye'
+        b.save()
+        self.assertTrue(isinstance(cache.get(key), StaleData))
+        self.assertEqual(
+            b, cache.get(BCacheOnTextReset.get_key('bye')).value)
+        self.assertRaises(ModelB.DoesNotExist, BCacheOnTextReset.get, 'hello')
+
+        # instance saved with expression is not written
+        key = BCacheOnTextReset.get_key('bye')
+        b.num = F('num') + 1
+        b.save()
+        self.assertTrue(isinstance(cache.get(key), StaleData))
+        self.assertEqual(3, BCacheOnTextReset.get('bye').num)
+
+        # nor instance having value not of field's type
+        b = ModelB.objects.get(id=b.id)
+        b.num = '4'
+        b.save()
+        self.assertTrue(isinstance(cache.get(key), StaleData))
+        self.assertEqual(4, BCacheOnTextReset.get('bye').num)
+
+
+class GenerationTest(CacheTestCase):
+    def test_basic1(self):
+        a = ModelA.objects.create(num=1, text='hello')
+        self.assertEqual(a, ACacheOnTextGeneration.get('hello'))
+        key = ACacheOnTextGeneration.get_key('hello')
+        self.assertEqual(a, cache.get(key).value)
+
+        # saves invalidate keys of current generation
+        a.num = 2
+        a.save()
+        self.assertTrue(isinstance(cache.get(key), StaleData))
+        self.assertEqual(2, ACacheOnTextGeneration.get('hello').num)
+
+        # bumping generation moves all keys to new ones
+        ACacheOnTextGeneration.bump_generation()
+        new_key = ACacheOnTextGeneration.get_key('hello')
+        self.assertNotEqual(key, new_key)
+        self.assertEqual(None, cache.get(new_key))
+        self.assertEqual(2, ACacheOnTextGeneration.get('hello').num)
+        self.assertEqual(a, cache.get(new_key).value)
+
+    def test_other_process(self):
+        a = ModelA.objects.create(num=1, text='hello')
+        self.assertEqual(a, ACacheOnTextGeneration.get('hello'))
+        key = ACacheOnTextGeneration.get_key('hello')
+
+        # generation bumped by another process is seen on next get
+        cache.incr(ACacheOnTextGeneration.get_generation_key())
+        cursor = connection.cursor()
+        cursor.execute("UPDATE %s SET num = 2" % ModelA._meta.db_table)
+        self.assertEqual(2, ACacheOnTextGeneration.get('hello').num)
+        self.assertNotEqual(key, ACacheOnTextGeneration.get_key('hello'))
+
+    def test_select_related(self):
+        a = ModelA.objects.create(num=1, text='hello')
+        b = ModelB.objects.create(num=1, text='hello', a=a)
+        self.assertEqual('hello', BCacheOnNumGeneration.get(1).a.text)
+        related_cache = BCacheOnNumGeneration.related_caches['a']
+        related_key = related_cache.get_key(1)
+        self.assertEqual(a, cache.get(related_key))
+
+        # generations of related caches are got along with the value
+        cache.incr(related_cache.get_generation_key())
+        cursor = connection.cursor()
+        cursor.execute("UPDATE %s SET text = 'bye'" % ModelA._meta.db_table)
+        self.assertEqual('bye', BCacheOnNumGeneration.get(1).a.text)
+        self.assertNotEqual(related_key, related_cache.get_key(1))
+
+
+class DynamicVersionTest(CacheTestCase):
+    def test_refresh(self):
+        self.assertEqual(0, ACacheOnText().get_dynamic_version())
+        # version changed by another process
+        CacheDynamicVersion.objects.filter(
+            cache_type=ACacheOnText.cache_type,
+            cache_name=ACacheOnText.__name__).update(version=5)
+        CacheDynamicVersion.objects.increment_epoch()
+
+        # it's seen after check interval
+        self.assertEqual(0, ACacheOnText().get_dynamic_version())
+        CacheDynamicVersionManager._next_check_at = 0
+        self.assertEqual(5, ACacheOnText().get_dynamic_version())
+
+        CacheDynamicVersion.objects.increment_version_of(ACacheOnText)
+        self.assertEqual(6, ACacheOnText().get_dynamic_version())
+
+
+@unittest.skipIf(six.PY2, 'asyncio needs python 3')
+class AsyncTest(CacheTestMixin, TransactionTestCase):
+    def run_in_loop(self, awaitable_func):
+        import asyncio
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            return loop.run_until_complete(awaitable_func())
+        finally:
+            loop.close()
+
+    def test_basic1(self):
+        import asyncio
+        a = ModelA.objects.create(num=1, text='hello')
+        b = ModelB.objects.create(num=1, text='hello', a=a)
+
+        def get_values():
+            return asyncio.gather(
+                ACacheOnText.aget('hello'),
+                ModelA.cache.get_async(num=1),
+                BCacheOnNum(1).aresolve(),
+                ACacheOnText.aget('hello'))
+
+        # got from db and set in cache
+        self.assertEqual([a, a, b, a], self.run_in_loop(get_values))
+        self.assertEqual(a, cache.get(ACacheOnText.get_key('hello')).value)
+        # got from cache
+        self.assertEqual([a, a, b, a], self.run_in_loop(get_values))
+
+    def test_exceptions(self):
+        import asyncio
+        a = ModelA.objects.create(num=1, text='hello')
+
+        def get_values():
+            return asyncio.gather(
+                ModelA.cache.get_async(num=1),
+                ModelA.cache.get_async(num=2),
+                ModelA.cache.get_async_or_none(num=2),
+                return_exceptions=True)
+
+        a1, e, none = self.run_in_loop(get_values)
+        self.assertEqual(a, a1)
+        self.assertTrue(isinstance(e, ModelA.DoesNotExist))
+        self.assertEqual(None, none)
+
+    def test_not_blocking(self):
+        a = ModelA.objects.create(num=1, text='hello')
+        ACacheOnText.get('hello')
+
+        # cache and db calls made while resolving cache queries are made
+        # outside the event loop's thread
+        threads = []
+        manager = CacheDynamicVersion.objects
+        get_version_of = manager.get_version_of
+
+        def recording_get_version_of(cache_class):
+            threads.append(threading.current_thread())
+            return get_version_of(cache_class)
+
+        manager.get_version_of = recording_get_version_of
+        try:
+            self.assertEqual(a, self.run_in_loop(
+                lambda: ACacheOnText.aget('hello')))
+        finally:
+            del manager.get_version_of
+        self.assertTrue(threads)
+        self.assertFalse(threading.current_thread() in threads)
+
+
+@unittest.skipIf(not hasattr(transaction, 'on_commit'),
+                 'deferred invalidation needs transaction.on_commit')
+class DeferredInvalidationTest(CacheTestMixin, TransactionTestCase):
+    def test_basic1(self):
+        a = ModelA.objects.create(num=1, text='hello')
+        self.assertEqual('hello', ModelA.cache.get(num=1).text)
+        key = ModelA.cache.get_key(num=1)
+
+        with transaction.atomic():
+            a.text = 'bye'
+            a.save()
+
+            # key is invalidated on commit, till then it's read as
+            # invalidated in this thread and value got isn't cached
+            self.assertFalse(isinstance(cache.get(key), StaleData))
+            self.assertEqual('bye', ModelA.cache.get(num=1).text)
+            self.assertEqual('hello', cache.get(key).value.text)
+
+        self.assertTrue(isinstance(cache.get(key), StaleData))
+        self.assertEqual({}, get_pending_invalidations())
+        self.assertEqual('bye', ModelA.cache.get(num=1).text)
+
+    def test_rollback(self):
+        a = ModelA.objects.create(num=1, text='hello')
+        self.assertEqual('hello', ModelA.cache.get(num=1).text)
+
+        try:
+            with transaction.atomic():
+                a.text = 'bye'
+                a.save()
+                raise ValueError
+        except ValueError:
+            pass
+
+        self.assertEqual({}, get_pending_invalidations())
+        self.assertEqual('hello', ModelA.cache.get(num=1).text)
+
+
+class ProcessCacheTest(CacheTestCase):
+    def test_basic1(self):
+        a = ModelA.objects.create(num=1, text='hello')
+
+        self.assertEqual(a, ACacheOnText.get('hello'))
+
+        # value is served from process cache even if memcached lost it
+        key = ACacheOnText.get_key('hello')
+        cache.delete(key)
+        self.assertEqual(a, ACacheOnText.get('hello'))
+
+        a.num = 2
+        a.save()
+
+        self.assertEqual(2, ACacheOnText.get('hello').num)
+
+
+class SerializerTest(CacheTestCase):
+    def test_basic1(self):
+        a = ModelA.objects.create(num=1, text='hello')
+        serializer = ModelInstanceSerializer()
+
+        value = serializer.dumps([a, None])
+        self.assertIsInstance(value[0], InstanceData)
+        self.assertEqual([a, None], serializer.loads(value))
+        self.assertEqual('hello', serializer.loads(value)[0].text)
+
+        # instances with deferred fields are kept as they are
+        a = ModelA.objects.only('num').get(id=a.id)
+        self.assertIs(a, serializer.dumps(a))
+
+    def test_basic2(self):
+        a = ModelA.objects.create(num=1, text='hello')
+        b = ModelB.objects.create(num=1, text='hello', a=a)
+        c = ModelC.objects.create(num=1, a=a, b=b)
+
+        self.assertEqual(c, CCacheOnNum.get(1))
+        self.assertEqual(c, CCacheOnNum.get(1))
+
+        # value cached with another schema is replaced
+        key = CCacheOnNum.get_key(1)
+        value = cache.get(key)
+        instance_data = value.value
+        value.value = InstanceData(instance_data.label, instance_data.db,
+                                   0, instance_data.values)
+        cache.set(key, value)
+        self.assertEqual(c, CCacheOnNum.get(1))
+        self.assertEqual(instance_data.fingerprint,
+                         cache.get(key).value.fingerprint)
+
+    def test_compression(self):
+        serializer = CompressingSerializer(threshold=100)
+
+        value = serializer.dumps('hello')
+        self.assertEqual(CompressingSerializer.RAW, value[:1])
+        self.assertEqual('hello', serializer.loads(value))
+
+        value = serializer.dumps(['hello'] * 100)
+        self.assertEqual(CompressingSerializer.ZLIB, value[:1])
+        self.assertTrue(len(value) < 100)
+        self.assertEqual(['hello'] * 100, serializer.loads(value))
+
+        # values cached before compression was turned on
+        self.assertEqual(['hello'], serializer.loads(['hello']))
+
+        serializer = CompressingSerializer(
+            threshold=100, serializer=ModelInstanceSerializer())
+        a_list = [ModelA.objects.create(num=i, text='hello')
+                  for i in range(10)]
+        self.assertEqual(a_list, serializer.loads(serializer.dumps(a_list)))
+
+
+class CASTest(CacheTestCase):
+    def test_emulated_cas(self):
+        cache_cas = EmulatedCAS()
+        cache.set('cas_key', StaleData(1))
+
+        value, cas_token = cache_cas.gets_many(['cas_key'])['cas_key']
+        self.assertEqual(StaleData(1), value)
+
+        cache.set('cas_key', StaleData(2))
+        self.assertFalse(cache_cas.cas('cas_key', 'new', cas_token, 10))
+
+        value, cas_token = cache_cas.gets_many(['cas_key'])['cas_key']
+        self.assertTrue(cache_cas.cas('cas_key', 'new', cas_token, 10))
+        self.assertEqual('new', cache.get('cas_key'))
+
+
+class SingleFlightTest(CacheTestCase):
+    def test_basic1(self):
+        single_flight = SingleFlight()
+        calls = []
+        results = {}
+
+        def resolve(indexes):
+            calls.append(indexes)
+            time.sleep(0.5)
+            return [(False, ['value'])]
+
+        def run(name):
+            results[name] = single_flight.resolve_many(['key'], resolve, 5)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, len(calls))
+        for i in range(3):
+            self.assertEqual([(False, ['value'])], results[i])
+
+    def test_basic2(self):
+        single_flight = SingleFlight()
+        error = ValueError('db error')
+        results = {}
+
+        def resolve(indexes):
+            time.sleep(0.5)
+            return [(True, error)]
+
+        def run(name):
+            results[name] = single_flight.resolve_many(['key'], resolve, 5)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([(True, error)], results[0])
+        self.assertEqual([(True, error)], results[1])
+
+    def test_invalidated(self):
+        single_flight = SingleFlight()
+        calls = []
+
+        def resolve(indexes):
+            calls.append(indexes)
+            time.sleep(0.5)
+            return [(False, ['value'])]
+
+        # keys found invalidated are not shared
+        stale_data_dict = {'key': StaleData(time.time())}
+        flight_key = get_flight_key(['key'], stale_data_dict)
+        self.assertEqual(None, flight_key)
+        self.assertEqual('key', get_flight_key(['key'], {}))
+
+        def run():
+            single_flight.resolve_many([flight_key], resolve, 5)
+
+        threads = [threading.Thread(target=run) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(2, len(calls))
+        self.assertEqual({}, single_flight.flights)
+
+
+class CollectorTest(CacheTestCase):
+    def test_paths(self):
+        class UserCollector(LazyCollector):
+            params_list = [('user_id',), ('username',)]
+            collectables = ['user', 'user_id', 'score']
+            collector = {'all': ['user', 'score']}
+
+            @connect('user_id', 'user', cache_hit=True)
+            def get_user(self, user_id):
+                pass
+
+            @connect('username', 'user', cache_hit=True)
+            def get_user_by_username(self, username):
+                pass
+
+            @connect('user', 'user_id')
+            def get_user_id(self, user):
+                pass
+
+            @connect('user_id', 'score', cache_hit=True)
+            def get_score(self, user_id):
+                pass
+
+            @connect('user', 'score', cache_hit=True)
+            def get_score_of_user(self, user):
+                pass
+
+        paths = UserCollector.paths
+        self.assertTrue(paths[('user_id', ('user_id',))] is Identity)
+        connection, _ = paths[('score', ('user_id',))]
+        self.assertEqual(('user_id',), connection['from_nodes'])
+        connection, (user_path,) = paths[('user_id', ('username',))]
+        self.assertEqual(('user',), connection['from_nodes'])
+        self.assertEqual(('username',), user_path[0]['from_nodes'])
+
+    def test_unreachable(self):
+        with self.assertRaises(AssertionError) as cm:
+            class UserCollector(LazyCollector):
+                params_list = [('user_id',)]
+                collectables = ['user']
+                collector = {}
+        self.assertTrue('user from' in str(cm.exception))
@@ -3,13 +3,17 @@ from django.core.management import call_command
 from django.db.models import loading
 from django import test
 
+from flash import settings as flash_settings
 
-class TestCase(test.TestCase):
+
+class TestCaseMixin(object):
     apps = ('flash.tests',)
     tables_created = False
+    # whether keys invalidated in transactions are invalidated on commit
+    defer_invalidation = False
 
     def _pre_setup(self):
-        cls = TestCase
+        cls = TestCaseMixin
         if not cls.tables_created:
             # Add the models to the db.
             cls._original_installed_apps = list(settings.INSTALLED_APPS)
@@ -19,15 +23,32 @@ class TestCase(test.TestCase):
                 settings.INSTALLED_APPS.append(app)
             loading.cache.loaded = False
             call_command('syncdb', interactive=False, verbosity=0)
-            TestCase.tables_created = True
+            TestCaseMixin.tables_created = True
+
+        self._original_defer_invalidation = flash_settings.DEFER_INVALIDATION
+        flash_settings.DEFER_INVALIDATION = self.defer_invalidation
 
         # Call the original method that does the fixtures etc.
-        super(TestCase, self)._pre_setup()
+        super(TestCaseMixin, self)._pre_setup()
 
     def _post_teardown(self):
         # Call the original method.
-        super(TestCase, self)._post_teardown()
-        cls = TestCase
+        super(TestCaseMixin, self)._post_teardown()
+        cls = TestCaseMixin
+        flash_settings.DEFER_INVALIDATION = self._original_defer_invalidation
         # Restore the settings.
         settings.INSTALLED_APPS = cls._original_installed_apps
         loading.cache.loaded = False
+
+
+class TestCase(TestCaseMixin, test.TestCase):
+    """ Transactions of tests are never committed, so keys are invalidated
+    right away.
+    """
+
+
+class TransactionTestCase(TestCaseMixin, test.TransactionTestCase):
+    """ For tests of invalidation on commit of transactions, and tests
+    reading db in other threads, which see only committed rows.
+    """
+    defer_invalidation = True
@@ -3,31 +3,68 @@ import base64
 import hashlib
 from collections import defaultdict
 
+import six
 
-ACCEPTABLE_KEY_REGEX = r"^[\w\d_-]+$"
+from flash import settings as flash_settings
+
+
+# only ascii letters and digits, \w matches other letters on python 3
+ACCEPTABLE_KEY_REGEX = r"^[A-Za-z0-9_-]+\Z"
 acceptable_key_regex_pattern = re.compile(ACCEPTABLE_KEY_REGEX)
 
+MAX_KEY_LENGTH = 250
+# number of characters of a long key kept before its hash
+LONG_KEY_PREFIX_LENGTH = 200
+
+# bytes which can be put in a memcached key as they are
+_safe_bytes = bytes(bytearray(range(33, 127)))
+# every other byte is put as ~ followed by its base64
+_escape_table = dict(
+    (i, u'~' + base64.b64encode(bytes(bytearray([i]))).decode('ascii'))
+    for i in range(256) if not 33 <= i < 127)
+
+
+def _escape_bytes(data):
+    """ Returns native string of given bytes having unsafe bytes escaped
+    """
+    if data.translate(None, _safe_bytes):
+        key = data.decode('latin-1').translate(_escape_table)
+    else:
+        key = data.decode('ascii')
+    return str(key)
+
+
 def memcache_key_escape(key):
+    """ Returns key which can be used with memcached.
+
+    Spaces, control and non ascii characters (as utf-8 bytes) are escaped
+    and keys longer than 250 characters are shortened to their first 200
+    characters followed by hash of the whole key.
     """
-    if isinstance(key, unicode):
-        key = key.encode('utf-8')
+    if flash_settings.LEGACY_KEY_ESCAPE:
+        return legacy_memcache_key_escape(key)
+    if (isinstance(key, str) and len(key) <= MAX_KEY_LENGTH and
+            acceptable_key_regex_pattern.match(key)):
+        return key
+    data = key.encode('utf-8') if isinstance(key, six.text_type) else key
+    key = _escape_bytes(data)
+    if len(key) > MAX_KEY_LENGTH:
+        key = '%s~%s' % (key[:LONG_KEY_PREFIX_LENGTH],
+                         hashlib.md5(data).hexdigest())
+    return key
+
+
+def legacy_memcache_key_escape(key):
+    """ Escapes key the way it was done before keys longer than 250
+    characters got readable prefix. Used with FLASH_LEGACY_KEY_ESCAPE
+    setting so that existing keys remain same during rollout.
     """
-    if acceptable_key_regex_pattern.match(key):
+    if isinstance(key, str) and acceptable_key_regex_pattern.match(key):
         return key
-    if not key.isalnum():
-        chars = []
-        for c in key:
-            if ord(c) > 32 and ord(c) < 127:
-                chars.append(c)
-            else:
-                c64 = base64.b64encode(c)
-                chars.append('~')
-                chars.append(c64)
-        key = ''.join(chars)
-    if len(key) > 250:
-        m = hashlib.md5()
-        m.update(key)
-        key = m.hexdigest()
+    data = key.encode('utf-8') if isinstance(key, six.text_type) else key
+    key = _escape_bytes(data)
+    if len(key) > MAX_KEY_LENGTH:
+        key = hashlib.md5(key.encode('ascii')).hexdigest()
     return key
 
 